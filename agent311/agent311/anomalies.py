@@ -0,0 +1,224 @@
+"""Daily request-count anomalies per type and per council district, maintained at ingest.
+
+`download_311` calls `update` with each delta. New rows (created after the last
+run's watermark) are counted into per-day buckets for their "type" and
+"district" series and for "all". The newest day in the data is still filling
+up, so counts stay pending until a later day appears. At that point each
+finished day is scored against its series' seasonal baseline:
+
+- one EWMA mean and variance per day of week (ANOMALY_EWMA_ALPHA);
+- z = (count - mean) / sd, where sd is floored at the Poisson level (sqrt of the mean);
+- the day is flagged when |z| >= ANOMALY_Z_THRESHOLD.
+
+The day is then folded into the baseline. The work is proportional to the new
+rows and the new days, never the whole history. The state, with flags kept for
+ANOMALY_RETENTION_DAYS, is a gzipped JSON file next to the CSV.
+"""
+
+import gzip
+import json
+import math
+import os
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+
+import pandas as pd
+
+STATE_FILENAME = "311_anomalies.json.gz"
+STATE_VERSION = 1
+ANOMALY_EWMA_ALPHA = float(os.environ.get("ANOMALY_EWMA_ALPHA", "0.15"))
+ANOMALY_Z_THRESHOLD = float(os.environ.get("ANOMALY_Z_THRESHOLD", "3.0"))
+# Observations of a weekday needed before that weekday can be flagged.
+ANOMALY_MIN_HISTORY = int(os.environ.get("ANOMALY_MIN_HISTORY", "4"))
+# Quiet series are noisy; ignore days where both count and baseline are below this.
+ANOMALY_MIN_COUNT = int(os.environ.get("ANOMALY_MIN_COUNT", "5"))
+ANOMALY_RETENTION_DAYS = int(os.environ.get("ANOMALY_RETENTION_DAYS", "60"))
+KEY_SEPARATOR = "\t"
+
+
+def _series_counts(df: pd.DataFrame) -> dict[str, dict[str, int]]:
+    """{series key: {YYYY-MM-DD: count}} for the type, district and overall series."""
+    day = df["sr_created_date"].astype(str).str[:10]
+    district = df["sr_location_council_district"]
+    if pd.api.types.is_float_dtype(district):
+        district = district.astype("Int64")
+    dimensions = {
+        "type": df["sr_type_desc"].fillna("unknown").astype(str),
+        "district": district.astype("string").fillna("unknown").astype(str),
+        "all": pd.Series("all", index=df.index),
+    }
+    counts: dict[str, dict[str, int]] = {}
+    for dimension, values in dimensions.items():
+        grouped = pd.DataFrame({"value": values, "day": day}).groupby(["value", "day"]).size()
+        for (value, d), n in grouped.items():
+            counts.setdefault(f"{dimension}{KEY_SEPARATOR}{value}", {})[d] = int(n)
+    return counts
+
+
+class Baseline:
+    """EWMA mean/variance of one series' daily count, per day of week."""
+
+    def __init__(self, mean=None, var=None, n=None):
+        self.mean = mean or [0.0] * 7
+        self.var = var or [0.0] * 7
+        self.n = n or [0] * 7
+
+    def score(self, weekday: int, count: int) -> tuple[float, float] | None:
+        """(expected, z) for a day's count, or None while there's too little history."""
+        if self.n[weekday] < ANOMALY_MIN_HISTORY:
+            return None
+        expected = self.mean[weekday]
+        sd = math.sqrt(max(self.var[weekday], expected, 1.0))
+        return expected, (count - expected) / sd
+
+    def add(self, weekday: int, count: int):
+        # Plain averaging for the first observations so the baseline isn't anchored at 0.
+        alpha = max(ANOMALY_EWMA_ALPHA, 1 / (self.n[weekday] + 1))
+        diff = count - self.mean[weekday]
+        self.mean[weekday] += alpha * diff
+        self.var[weekday] = (1 - alpha) * (self.var[weekday] + alpha * diff * diff)
+        self.n[weekday] += 1
+
+    def to_json(self) -> list:
+        return [[round(m, 3) for m in self.mean], [round(v, 3) for v in self.var], self.n]
+
+
+class AnomalyState:
+    def __init__(self):
+        self.baselines: dict[str, Baseline] = {}
+        # series -> {day: count} for days not yet scored (the newest, still-partial day)
+        self.pending: dict[str, dict[str, int]] = {}
+        self.flags: list[dict] = []
+        self.scored_through: str | None = None
+        self.created_watermark: str | None = None
+        self.updated_at: str | None = None
+
+    def apply(self, df: pd.DataFrame):
+        """Count rows created since the last run, then score every day that is now complete."""
+        if df.empty or "sr_created_date" not in df:
+            return
+        created = df["sr_created_date"].astype(str)
+        if self.created_watermark:
+            df = df[df["sr_created_date"].notna() & (created > self.created_watermark)]
+        else:
+            df = df[df["sr_created_date"].notna()]
+        if df.empty:
+            return
+        df = df.drop_duplicates(subset="sr_number", keep="first")
+        self.created_watermark = max(filter(None, [self.created_watermark, df["sr_created_date"].astype(str).max()]))
+
+        for key, days in _series_counts(df).items():
+            pending = self.pending.setdefault(key, {})
+            for d, n in days.items():
+                if self.scored_through is None or d > self.scored_through:
+                    pending[d] = pending.get(d, 0) + n
+            self.baselines.setdefault(key, Baseline())
+
+        # Everything before the newest day is complete.
+        newest = date.fromisoformat(self.created_watermark[:10])
+        first_pending = min((d for days in self.pending.values() for d in days), default=None)
+        if first_pending is None:
+            return
+        day = date.fromisoformat(first_pending)
+        if self.scored_through is not None:
+            day = max(day, date.fromisoformat(self.scored_through) + timedelta(days=1))
+        while day < newest:
+            self._score_day(day.isoformat(), day.weekday())
+            day += timedelta(days=1)
+
+        cutoff = (newest - timedelta(days=ANOMALY_RETENTION_DAYS)).isoformat()
+        self.flags = [f for f in self.flags if f["date"] >= cutoff]
+        self.pending = {k: v for k, v in self.pending.items() if v}
+        self.updated_at = datetime.now(timezone.utc).isoformat(timespec="seconds")
+
+    def _score_day(self, day: str, weekday: int):
+        for key, baseline in self.baselines.items():
+            count = self.pending.get(key, {}).pop(day, 0)
+            scored = baseline.score(weekday, count)
+            if scored is not None:
+                expected, z = scored
+                if abs(z) >= ANOMALY_Z_THRESHOLD and max(count, expected) >= ANOMALY_MIN_COUNT:
+                    dimension, value = key.split(KEY_SEPARATOR, 1)
+                    self.flags.append({
+                        "date": day,
+                        "dimension": dimension,
+                        "value": value,
+                        "count": count,
+                        "expected": round(expected, 1),
+                        "z": round(z, 2),
+                        "direction": "spike" if z > 0 else "drop",
+                    })
+            baseline.add(weekday, count)
+        self.scored_through = day
+
+    def query(self, days: int = 7, dimension: str | None = None, value: str | None = None) -> dict:
+        """Flags from the last `days` scored days, strongest first."""
+        anomalies = []
+        if self.scored_through:
+            since = (date.fromisoformat(self.scored_through) - timedelta(days=days - 1)).isoformat()
+            anomalies = [
+                f for f in self.flags
+                if f["date"] >= since
+                and (not dimension or f["dimension"] == dimension)
+                and (not value or f["value"].lower() == value.strip().lower())
+            ]
+            anomalies.sort(key=lambda f: -abs(f["z"]))
+        return {
+            "scoredThrough": self.scored_through,
+            "updatedAt": self.updated_at,
+            "zThreshold": ANOMALY_Z_THRESHOLD,
+            "anomalies": anomalies,
+        }
+
+    def to_json(self) -> dict:
+        return {
+            "version": STATE_VERSION,
+            "updatedAt": self.updated_at,
+            "scoredThrough": self.scored_through,
+            "createdWatermark": self.created_watermark,
+            "baselines": {k: b.to_json() for k, b in self.baselines.items()},
+            "pending": self.pending,
+            "flags": self.flags,
+        }
+
+    @classmethod
+    def from_json(cls, data: dict) -> "AnomalyState":
+        state = cls()
+        state.updated_at = data.get("updatedAt")
+        state.scored_through = data.get("scoredThrough")
+        state.created_watermark = data.get("createdWatermark")
+        state.baselines = {k: Baseline(*b) for k, b in data["baselines"].items()}
+        state.pending = data["pending"]
+        state.flags = data["flags"]
+        return state
+
+
+def load(path: Path) -> AnomalyState | None:
+    try:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return None
+    if data.get("version") != STATE_VERSION:
+        return None
+    return AnomalyState.from_json(data)
+
+
+def save(state: AnomalyState, path: Path):
+    tmp = path.with_name(path.name + ".tmp")
+    with gzip.open(tmp, "wt", encoding="utf-8", compresslevel=6) as f:
+        json.dump(state.to_json(), f, separators=(",", ":"))
+    os.replace(tmp, path)
+
+
+def update(data_dir: Path, changed: pd.DataFrame, full: pd.DataFrame) -> AnomalyState:
+    """Apply an ingest's new rows, or build from the full snapshot when there is no state yet."""
+    path = data_dir / STATE_FILENAME
+    state = load(path)
+    if state is None:
+        state = AnomalyState()
+        state.apply(full)
+    else:
+        state.apply(changed)
+    save(state, path)
+    return state
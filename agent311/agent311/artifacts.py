@@ -0,0 +1,215 @@
+"""Metadata index for report and chart artifacts.
+
+The `artifacts` table mirrors what is on the volume so listings never touch the
+filesystem. Every write path (save_report, save_chart, upload, rename, delete)
+updates it, and `reconcile` repairs drift at startup (files copied in by hand,
+writes that crashed midway).
+"""
+
+import hashlib
+import os
+from datetime import datetime, timezone
+from pathlib import Path
+
+from sqlalchemy import and_, delete, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from agent311 import fileio
+from agent311.db import Artifact, get_async_session
+
+SORTS = {
+    # sort name -> (column, descending)
+    "modified": (Artifact.modified_at, True),
+    "name": (Artifact.name, False),
+    "size": (Artifact.size_bytes, True),
+}
+
+
+def _stat(path: Path) -> tuple[int, datetime]:
+    st = path.stat()
+    return st.st_size, datetime.fromtimestamp(st.st_mtime, tz=timezone.utc)
+
+
+async def record(path: Path, kind: str, sha256: str | None = None, pinned: bool | None = None) -> Artifact:
+    """Insert or refresh the index entry for a file that was just written.
+
+    `pinned` is left as it was when None.
+    """
+    size, modified = await fileio.run(_stat, path)
+    entry = Artifact(
+        path=str(path),
+        name=path.name,
+        kind=kind,
+        type=path.suffix.lstrip(".").lower(),
+        size_bytes=size,
+        modified_at=modified,
+        last_accessed_at=modified,
+        sha256=sha256,
+    )
+    if pinned is not None:
+        entry.pinned = pinned
+    async with get_async_session()() as db:
+        artifact = await db.merge(entry)
+        await db.commit()
+    return artifact
+
+
+def _hash_file(path: Path) -> str:
+    with open(path, "rb") as f:
+        return hashlib.file_digest(f, "sha256").hexdigest()
+
+
+async def content_hash(path: Path, kind: str, stat_result: os.stat_result) -> str:
+    """sha256 of the file, from the index when it is still current, else computed and stored."""
+    modified = datetime.fromtimestamp(stat_result.st_mtime, tz=timezone.utc)
+    async with get_async_session()() as db:
+        artifact = await db.get(Artifact, str(path))
+    if (
+        artifact is not None
+        and artifact.sha256
+        and artifact.size_bytes == stat_result.st_size
+        and _as_utc(artifact.modified_at) == modified
+    ):
+        return artifact.sha256
+    sha256 = await fileio.run(_hash_file, path)
+    await record(path, kind, sha256=sha256)
+    return sha256
+
+
+async def remove(path: Path):
+    async with get_async_session()() as db:
+        await db.execute(delete(Artifact).where(Artifact.path == str(path)))
+        await db.commit()
+
+
+async def rename(old_path: Path, new_path: Path, kind: str):
+    # The primary key changes, so the row is replaced rather than updated.
+    sha256 = pinned = None
+    async with get_async_session()() as db:
+        artifact = await db.get(Artifact, str(old_path))
+        if artifact is not None:
+            sha256, pinned = artifact.sha256, artifact.pinned
+            await db.delete(artifact)
+            await db.commit()
+    await record(new_path, kind, sha256=sha256, pinned=pinned)
+
+
+async def set_pinned(path: Path, pinned: bool) -> Artifact | None:
+    async with get_async_session()() as db:
+        artifact = await db.get(Artifact, str(path))
+        if artifact is not None:
+            artifact.pinned = pinned
+            await db.commit()
+    return artifact
+
+
+def _scan(directories: dict[str, tuple[Path, set[str]]]) -> dict[str, tuple[str, int, datetime]]:
+    found = {}
+    for kind, (directory, extensions) in directories.items():
+        if not directory.exists():
+            continue
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if not entry.is_file():
+                    continue
+                ext = os.path.splitext(entry.name)[1].lower()
+                if ext not in extensions:
+                    continue
+                st = entry.stat()
+                path = str(directory / entry.name)
+                found[path] = (kind, st.st_size, datetime.fromtimestamp(st.st_mtime, tz=timezone.utc))
+    return found
+
+
+async def reconcile(directories: dict[str, tuple[Path, set[str]]]) -> dict:
+    """Bring the index in line with the directories: {kind: (dir, allowed extensions)}."""
+    found = await fileio.run(_scan, directories)
+    added = updated = removed = 0
+    async with get_async_session()() as db:
+        result = await db.execute(select(Artifact).where(Artifact.kind.in_(directories)))
+        indexed = {a.path: a for a in result.scalars().all()}
+
+        for path, artifact in indexed.items():
+            if path not in found:
+                await db.delete(artifact)
+                removed += 1
+
+        for path, (kind, size, modified) in found.items():
+            artifact = indexed.get(path)
+            if artifact is None:
+                p = Path(path)
+                db.add(Artifact(
+                    path=path, name=p.name, kind=kind, type=p.suffix.lstrip(".").lower(),
+                    size_bytes=size, modified_at=modified,
+                ))
+                added += 1
+                continue
+            changed = False
+            if artifact.size_bytes != size or _as_utc(artifact.modified_at) != modified:
+                artifact.size_bytes = size
+                artifact.modified_at = modified
+                artifact.sha256 = None  # content changed outside the app; rehash lazily
+                changed = True
+            updated += changed
+        await db.commit()
+    return {"added": added, "updated": updated, "removed": removed, "total": len(found)}
+
+
+def _as_utc(value: datetime) -> datetime:
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value
+
+
+def sort_key(artifact: Artifact, sort: str) -> list:
+    """Cursor values for the last row of a page under `sort`."""
+    column, _ = SORTS[sort]
+    value = getattr(artifact, column.key)
+    if isinstance(value, datetime):
+        value = _as_utc(value).isoformat()
+    return [value, artifact.path]
+
+
+async def list_artifacts(
+    db: AsyncSession,
+    sort: str = "modified",
+    kind: str | None = None,
+    type: str | None = None,
+    q: str | None = None,
+    after: list | None = None,
+    limit: int = 100,
+) -> list[Artifact]:
+    """Return up to `limit` artifacts ordered by `sort`, starting after the `after` key."""
+    column, descending = SORTS[sort]
+    query = select(Artifact)
+    if kind:
+        query = query.where(Artifact.kind == kind)
+    if type:
+        query = query.where(Artifact.type == type.lower().lstrip("."))
+    if q:
+        query = query.where(Artifact.name.icontains(q, autoescape=True))
+    if after:
+        value, path = after
+        if column is Artifact.modified_at:
+            value = datetime.fromisoformat(value)
+        if descending:
+            query = query.where(or_(column < value, and_(column == value, Artifact.path < path)))
+        else:
+            query = query.where(or_(column > value, and_(column == value, Artifact.path > path)))
+    if descending:
+        query = query.order_by(column.desc(), Artifact.path.desc())
+    else:
+        query = query.order_by(column, Artifact.path)
+    result = await db.execute(query.limit(limit))
+    return list(result.scalars().all())
+
+
+def artifact_to_dict(artifact: Artifact) -> dict:
+    return {
+        "name": artifact.name,
+        "path": artifact.path,
+        "kind": artifact.kind,
+        "type": artifact.type,
+        "sizeBytes": artifact.size_bytes,
+        "modifiedAt": _as_utc(artifact.modified_at).isoformat(),
+        "sha256": artifact.sha256,
+        "pinned": bool(artifact.pinned),
+    }
@@ -10,8 +10,12 @@ DEFAULT_PASSWORD = "password"
 
 ALGORITHM = "HS256"
 TOKEN_EXPIRY_DAYS = 7
+LINK_TOKEN_EXPIRY_MINUTES = int(os.environ.get("LINK_TOKEN_EXPIRY_MINUTES", "60"))
+# Link tokens carry an audience; decoding without one (login tokens) rejects them.
+LINK_AUDIENCE_PREFIX = "link:"
 
 security = HTTPBearer()
+optional_security = HTTPBearer(auto_error=False)
 
 
 def _get_jwt_secret() -> str:
@@ -42,7 +46,7 @@ async def get_current_user(
             credentials.credentials, _get_jwt_secret(), algorithms=[ALGORITHM]
         )
         email: str = payload.get("sub", "")
-        if not email:
+        if not email or "scope" in payload:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token"
             )
@@ -55,3 +59,41 @@ async def get_current_user(
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token"
         )
+
+
+async def get_optional_user(
+    credentials: HTTPAuthorizationCredentials | None = Depends(optional_security),
+) -> str | None:
+    """Like get_current_user, but None when no Authorization header was sent."""
+    if credentials is None:
+        return None
+    return await get_current_user(credentials)
+
+
+def create_link_token(scope: str, params: dict) -> str:
+    """Short-lived token for a plain link (no Authorization header) to one request."""
+    payload = {
+        "sub": "link",
+        "aud": LINK_AUDIENCE_PREFIX + scope,
+        "scope": scope,
+        "params": params,
+        "exp": datetime.now(timezone.utc) + timedelta(minutes=LINK_TOKEN_EXPIRY_MINUTES),
+    }
+    return jwt.encode(payload, _get_jwt_secret(), algorithm=ALGORITHM)
+
+
+def verify_link_token(token: str, scope: str) -> dict:
+    """The params a link token was issued for."""
+    try:
+        payload = jwt.decode(
+            token, _get_jwt_secret(), algorithms=[ALGORITHM], audience=LINK_AUDIENCE_PREFIX + scope
+        )
+    except jwt.ExpiredSignatureError:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED, detail="Link expired"
+        )
+    except jwt.InvalidTokenError:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid link"
+        )
+    return payload.get("params", {})
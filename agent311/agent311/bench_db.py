@@ -0,0 +1,157 @@
+"""Benchmark the session and message endpoints under a database engine profile.
+
+Runs the FastAPI app in-process (no network) against DATABASE_URL, or a
+throwaway SQLite file when it is unset, and reports throughput and latency
+per endpoint. Compare profiles by running it once per DB_PROFILE:
+
+    DB_PROFILE=minimal uv run python -m agent311.bench_db
+    DB_PROFILE=tuned uv run python -m agent311.bench_db
+    DATABASE_URL=postgresql://... uv run python -m agent311.bench_db
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+BENCH_PREFIX = "bench-"
+
+
+async def _run_scenario(client, name: str, make_request, requests: int, concurrency: int) -> dict:
+    latencies: list[float] = []
+    counter = iter(range(requests))
+
+    async def worker():
+        for i in counter:
+            start = time.perf_counter()
+            res = await make_request(client, i)
+            latencies.append(time.perf_counter() - start)
+            if res.status_code >= 400:
+                raise RuntimeError(f"{name}: HTTP {res.status_code} {res.text[:200]}")
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "scenario": name,
+        "requests": requests,
+        "rps": requests / elapsed,
+        "p50": statistics.median(latencies) * 1000,
+        "p95": latencies[int(len(latencies) * 0.95) - 1] * 1000,
+    }
+
+
+async def _seed(sessions: int, messages: int) -> tuple[list[str], list[str]]:
+    from agent311.db import Message, Session, get_async_session
+
+    session_ids = [f"{BENCH_PREFIX}{uuid.uuid4()}" for _ in range(sessions)]
+    message_ids = []
+    async with get_async_session()() as db:
+        for sid in session_ids:
+            db.add(Session(id=sid, title="Bench session"))
+            for n in range(messages):
+                mid = f"{BENCH_PREFIX}{uuid.uuid4()}"
+                message_ids.append(mid)
+                db.add(Message(
+                    id=mid,
+                    session_id=sid,
+                    role="user" if n % 2 == 0 else "assistant",
+                    content="District 4 pothole requests by month. " * 20,
+                ))
+        await db.commit()
+    return session_ids, message_ids
+
+
+async def _cleanup():
+    from sqlalchemy import delete
+
+    from agent311.db import Message, Session, get_async_session
+
+    async with get_async_session()() as db:
+        await db.execute(delete(Message).where(Message.id.startswith(BENCH_PREFIX)))
+        await db.execute(delete(Session).where(Session.id.startswith(BENCH_PREFIX)))
+        await db.commit()
+
+
+async def bench(args) -> list[dict]:
+    import httpx
+
+    from agent311.auth import DEFAULT_EMAIL, create_token
+    from agent311.main import app, lifespan
+
+    headers = {"Authorization": f"Bearer {create_token(DEFAULT_EMAIL)}"}
+    transport = httpx.ASGITransport(app=app)
+
+    async with lifespan(app):
+        session_ids, message_ids = await _seed(args.sessions, args.messages)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", headers=headers) as client:
+
+            def pick(ids, i):
+                return ids[i % len(ids)]
+
+            scenarios = {
+                "POST /api/sessions": lambda c, i: c.post(
+                    "/api/sessions", json={"id": f"{BENCH_PREFIX}{uuid.uuid4()}", "title": "Bench"}
+                ),
+                "GET /api/sessions": lambda c, i: c.get("/api/sessions", params={"limit": 50}),
+                "GET /api/sessions/{id}": lambda c, i: c.get(f"/api/sessions/{pick(session_ids, i)}"),
+                "GET /api/sessions/{id}/messages": lambda c, i: c.get(
+                    f"/api/sessions/{pick(session_ids, i)}/messages", params={"limit": 20}
+                ),
+                "PATCH /api/messages/{id}": lambda c, i: c.patch(
+                    f"/api/messages/{pick(message_ids, i)}", json={"content": f"edited {i}"}
+                ),
+            }
+
+            async def mixed(c, i):
+                # 4 reads for every write, the rough shape of sidebar + chat traffic.
+                if i % 5 == 0:
+                    return await scenarios["PATCH /api/messages/{id}"](c, i)
+                if i % 5 in (1, 2):
+                    return await scenarios["GET /api/sessions/{id}/messages"](c, i)
+                return await scenarios["GET /api/sessions"](c, i)
+
+            scenarios["mixed 80/20 read/write"] = mixed
+
+            results = []
+            for name, make_request in scenarios.items():
+                results.append(await _run_scenario(client, name, make_request, args.requests, args.concurrency))
+        await _cleanup()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=200, help="sessions to seed")
+    parser.add_argument("--messages", type=int, default=40, help="messages per seeded session")
+    parser.add_argument("--requests", type=int, default=1000, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=32)
+    args = parser.parse_args()
+
+    tmpdir = None
+    if not os.environ.get("DATABASE_URL"):
+        tmpdir = tempfile.TemporaryDirectory()
+        os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{Path(tmpdir.name) / 'bench.db'}"
+
+    from agent311.db import DB_PROFILE, _get_database_url
+
+    url, is_sqlite = _get_database_url()
+    print(f"profile={DB_PROFILE} backend={'sqlite' if is_sqlite else 'postgres'} "
+          f"concurrency={args.concurrency} requests/scenario={args.requests}")
+    results = asyncio.run(bench(args))
+
+    print(f"{'scenario':<34}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}")
+    for r in results:
+        print(f"{r['scenario']:<34}{r['rps']:>10.0f}{r['p50']:>10.1f}{r['p95']:>10.1f}")
+
+    if tmpdir is not None:
+        tmpdir.cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""Cross-process coordination for running several uvicorn workers on one volume.
+
+All of it is built on `flock` locks under LOCK_DIR, which the kernel releases
+when a process exits, so a crashed worker never leaves a stale lock behind:
+
+- `startup_lock` serializes schema creation and the artifact reconcile.
+- `LeaderElection` picks the one worker that runs singleton background jobs
+  (storage sweeps). The others keep retrying and take over if it exits.
+- `hold` / `is_held` mark a file as in use by a live process (per-run scratch
+  directories), so another worker's sweep can tell active from orphaned.
+"""
+
+import asyncio
+import fcntl
+import logging
+import os
+from contextlib import asynccontextmanager
+from pathlib import Path
+
+from agent311 import fileio
+
+logger = logging.getLogger(__name__)
+
+# Same directory as download_311.get_data_dir(); importing it here would be circular.
+_volume_mount = os.environ.get("RAILWAY_VOLUME_MOUNT_PATH", str(Path(__file__).resolve().parent.parent / "data"))
+LOCK_DIR = Path(_volume_mount) / ".locks"
+LEADER_RETRY_SECONDS = int(os.environ.get("LEADER_RETRY_SECONDS", "15"))
+
+
+def _open_lock(path: Path) -> int:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    return os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+
+
+def try_lock(path: Path) -> int | None:
+    """Take an exclusive lock without waiting. Returns the fd to keep it, or None."""
+    fd = _open_lock(path)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        os.close(fd)
+        return None
+    return fd
+
+
+def release(fd: int):
+    fcntl.flock(fd, fcntl.LOCK_UN)
+    os.close(fd)
+
+
+def lock(path: Path) -> int:
+    """Take an exclusive lock, waiting for it. Returns the fd to release."""
+    fd = _open_lock(path)
+    fcntl.flock(fd, fcntl.LOCK_EX)
+    return fd
+
+
+@asynccontextmanager
+async def startup_lock(name: str = "startup"):
+    """Exclusive section across workers; waits on the file I/O pool, not the loop."""
+    fd = await fileio.run(lock, LOCK_DIR / f"{name}.lock")
+    try:
+        yield
+    finally:
+        release(fd)
+
+
+def hold(path: Path) -> int:
+    """Lock path for as long as this process keeps the returned fd open."""
+    fd = try_lock(path)
+    if fd is None:
+        raise RuntimeError(f"{path} is already held by another process")
+    return fd
+
+
+def is_held(path: Path) -> bool:
+    """Whether a live process (this one included) holds path's lock."""
+    if not path.exists():
+        return False
+    fd = try_lock(path)
+    if fd is None:
+        return True
+    release(fd)
+    return False
+
+
+class LeaderElection:
+    """Holds LOCK_DIR/leader.lock in at most one worker at a time."""
+
+    def __init__(self, name: str = "leader", retry: int = LEADER_RETRY_SECONDS):
+        self.path = LOCK_DIR / f"{name}.lock"
+        self.retry = retry
+        self._fd: int | None = None
+        self._task: asyncio.Task | None = None
+
+    @property
+    def is_leader(self) -> bool:
+        return self._fd is not None
+
+    async def _try_acquire(self):
+        if self._fd is None:
+            self._fd = await fileio.run(try_lock, self.path)
+            if self._fd is not None:
+                logger.info(f"Worker {os.getpid()} is the leader")
+
+    async def start(self):
+        if self._task is None:
+            await self._try_acquire()
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._fd is not None:
+            release(self._fd)
+            self._fd = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.retry)
+            try:
+                await self._try_acquire()
+            except OSError:
+                logger.exception("Leader election failed")
+
+    def stats(self) -> dict:
+        return {"pid": os.getpid(), "leader": self.is_leader}
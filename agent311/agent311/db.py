@@ -2,9 +2,27 @@ import os
 import uuid
 from datetime import datetime, timezone
 
-from sqlalchemy import Boolean, Column, DateTime, ForeignKey, String, Text, text
+from sqlalchemy import (
+    BigInteger,
+    Boolean,
+    Column,
+    DateTime,
+    ForeignKey,
+    Index,
+    Integer,
+    LargeBinary,
+    String,
+    Text,
+    event,
+    inspect,
+    text,
+)
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import DeclarativeBase, relationship
+from sqlalchemy.orm import Session as SyncSession
+from sqlalchemy.sql.dml import UpdateBase
+
+from agent311.search import create_search_index
 
 
 def _get_database_url() -> tuple[str, bool]:
@@ -12,6 +30,8 @@ def _get_database_url() -> tuple[str, bool]:
     url = os.environ.get("DATABASE_URL", "")
     if not url:
         return "sqlite+aiosqlite:///./agent311_local.db", True
+    if url.startswith("sqlite"):
+        return url, True
     # Railway provides postgres:// but asyncpg needs postgresql+asyncpg://
     if url.startswith("postgres://"):
         url = url.replace("postgres://", "postgresql+asyncpg://", 1)
@@ -20,20 +40,143 @@ def _get_database_url() -> tuple[str, bool]:
     return url, False
 
 
+def _env_int(name: str, default: int) -> int:
+    return int(os.environ.get(name, default))
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    return os.environ.get(name, str(default)).strip().lower() in ("1", "true", "yes", "on")
+
+
+# Engine profiles. DB_PROFILE=minimal falls back to driver defaults (no pool
+# tuning, no pragmas, one SQLite engine) for comparison benchmarks.
+DB_PROFILE = os.environ.get("DB_PROFILE", "tuned")
+
+
+def _postgres_profile() -> dict:
+    return {
+        "pool_size": _env_int("DB_POOL_SIZE", 10),
+        "max_overflow": _env_int("DB_MAX_OVERFLOW", 20),
+        "pool_timeout": _env_int("DB_POOL_TIMEOUT", 30),
+        "pool_recycle": _env_int("DB_POOL_RECYCLE", 1800),
+        "pool_pre_ping": _env_bool("DB_POOL_PRE_PING", True),
+        "connect_args": {
+            # SQLAlchemy's per-connection prepared statement cache, and asyncpg's own.
+            # Set both to 0 behind pgbouncer in transaction mode.
+            "prepared_statement_cache_size": _env_int("DB_PREPARED_STATEMENT_CACHE_SIZE", 500),
+            "statement_cache_size": _env_int("DB_STATEMENT_CACHE_SIZE", 100),
+        },
+    }
+
+
+SQLITE_PRAGMAS = {
+    "journal_mode": os.environ.get("SQLITE_JOURNAL_MODE", "WAL"),
+    "synchronous": os.environ.get("SQLITE_SYNCHRONOUS", "NORMAL"),
+    "busy_timeout": _env_int("SQLITE_BUSY_TIMEOUT_MS", 5000),
+    "cache_size": _env_int("SQLITE_CACHE_SIZE_KB", 16000) * -1,
+    # Enforce ON DELETE CASCADE (e.g. message_bodies) the way Postgres does.
+    "foreign_keys": "ON",
+}
+
+
+def _sqlite_profile(writer: bool) -> dict:
+    # SQLite allows one writer at a time. A single-connection writer pool queues
+    # writes in-process instead of having them collide on the database lock;
+    # WAL lets the reader pool keep serving while a write is in flight.
+    return {
+        "pool_size": 1 if writer else _env_int("SQLITE_READERS", 4),
+        "max_overflow": 0,
+        "pool_timeout": _env_int("DB_POOL_TIMEOUT", 30),
+        "connect_args": {"check_same_thread": False},
+    }
+
+
+def _apply_sqlite_pragmas(dbapi_conn, _record):
+    cursor = dbapi_conn.cursor()
+    for name, value in SQLITE_PRAGMAS.items():
+        cursor.execute(f"PRAGMA {name}={value}")
+    cursor.close()
+
+
+# Execution options for large reads (AsyncSession.stream) that should fetch
+# rows through a server-side cursor instead of buffering the whole result.
+STREAM_OPTIONS = {
+    "stream_results": _env_bool("DB_SERVER_SIDE_CURSORS", True),
+    "yield_per": _env_int("DB_STREAM_YIELD_PER", 500),
+}
+
+
 engine = None
+reader_engine = None
 async_session = None
 _is_sqlite = False
 
 
+class _RoutingSession(SyncSession):
+    """Sends flushes and DML to the writer engine and plain reads to the reader pool.
+
+    Once a transaction has written, its reads stay on the writer until commit or
+    rollback, so they see the transaction's own uncommitted changes.
+    """
+
+    _wrote = False
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        if reader_engine is None:
+            return engine.sync_engine
+        if self._flushing or isinstance(clause, UpdateBase):
+            self._wrote = True
+        if self._wrote:
+            return engine.sync_engine
+        return reader_engine.sync_engine
+
+    def commit(self):
+        try:
+            super().commit()
+        finally:
+            self._wrote = False
+
+    def rollback(self):
+        try:
+            super().rollback()
+        finally:
+            self._wrote = False
+
+    def close(self):
+        try:
+            super().close()
+        finally:
+            self._wrote = False
+
+
 def _init_engine():
-    global engine, async_session, _is_sqlite
+    global engine, reader_engine, async_session, _is_sqlite
     if engine is None:
         url, _is_sqlite = _get_database_url()
-        kwargs = {"echo": False}
-        if _is_sqlite:
-            kwargs["connect_args"] = {"check_same_thread": False}
-        engine = create_async_engine(url, **kwargs)
-        async_session = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+        kwargs = {"echo": _env_bool("DB_ECHO", False)}
+        if DB_PROFILE == "minimal" or (_is_sqlite and ":memory:" in url):
+            if _is_sqlite:
+                kwargs["connect_args"] = {"check_same_thread": False}
+            engine = create_async_engine(url, **kwargs)
+        elif _is_sqlite:
+            engine = create_async_engine(url, **kwargs, **_sqlite_profile(writer=True))
+            event.listen(engine.sync_engine, "connect", _apply_sqlite_pragmas)
+            reader_engine = create_async_engine(url, **kwargs, **_sqlite_profile(writer=False))
+            event.listen(reader_engine.sync_engine, "connect", _apply_sqlite_pragmas)
+        else:
+            engine = create_async_engine(url, **kwargs, **_postgres_profile())
+        async_session = async_sessionmaker(
+            engine, class_=AsyncSession, sync_session_class=_RoutingSession, expire_on_commit=False
+        )
+
+
+async def dispose_engines():
+    """Close pooled connections (called on app shutdown)."""
+    global engine, reader_engine, async_session
+    for eng in (reader_engine, engine):
+        if eng is not None:
+            await eng.dispose()
+    engine = reader_engine = async_session = None
 
 
 class Base(DeclarativeBase):
@@ -42,6 +185,11 @@ class Base(DeclarativeBase):
 
 class Session(Base):
     __tablename__ = "sessions"
+    # Backs the sidebar ordering (is_favorite desc, updated_at desc, id desc)
+    # used by keyset pagination in list_sessions.
+    __table_args__ = (
+        Index("ix_sessions_favorite_updated_id", "is_favorite", "updated_at", "id"),
+    )
 
     id = Column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
     title = Column(String(255), nullable=False, default="New Chat")
@@ -68,6 +216,9 @@ class Session(Base):
 
 class Message(Base):
     __tablename__ = "messages"
+    __table_args__ = (
+        Index("ix_messages_session_created", "session_id", "created_at"),
+    )
 
     id = Column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
     session_id = Column(
@@ -81,22 +232,92 @@ class Message(Base):
         server_default=text("CURRENT_TIMESTAMP"),
         default=lambda: datetime.now(timezone.utc),
     )
+    # Set when the content is edited, so incremental sync can pick up edits.
+    updated_at = Column(DateTime(timezone=True), nullable=True)
+    # Large messages keep only an excerpt in `content`; the full text lives
+    # compressed in message_bodies (see agent311.message_store).
+    is_offloaded = Column(Boolean, nullable=False, server_default=text("false"), default=False)
+    content_size = Column(Integer, nullable=True)
 
     session = relationship("Session", back_populates="messages")
+    body = relationship(
+        "MessageBody", uselist=False, lazy="raise", cascade="all, delete-orphan", passive_deletes=True
+    )
+
+
+class MessageBody(Base):
+    __tablename__ = "message_bodies"
+
+    message_id = Column(
+        String(36), ForeignKey("messages.id", ondelete="CASCADE"), primary_key=True
+    )
+    codec = Column(String(16), nullable=False)
+    data = Column(LargeBinary, nullable=False)
+    raw_size = Column(Integer, nullable=False)
 
 
-async def create_tables():
+class Artifact(Base):
+    """Metadata index of files in the reports and charts directories."""
+
+    __tablename__ = "artifacts"
+    __table_args__ = (
+        Index("ix_artifacts_kind_modified", "kind", "modified_at", "path"),
+        Index("ix_artifacts_modified", "modified_at", "path"),
+        Index("ix_artifacts_name", "name", "path"),
+    )
+
+    path = Column(String(1024), primary_key=True)
+    name = Column(String(255), nullable=False)
+    kind = Column(String(16), nullable=False)  # "report" or "chart"
+    type = Column(String(16), nullable=False)  # extension without the dot
+    size_bytes = Column(BigInteger, nullable=False)
+    modified_at = Column(DateTime(timezone=True), nullable=False)
+    sha256 = Column(String(64), nullable=True)
+    last_accessed_at = Column(DateTime(timezone=True), nullable=True)
+    # Pinned artifacts (saved reports, uploads) are never evicted by the quota manager.
+    pinned = Column(Boolean, nullable=False, server_default=text("false"), default=False)
+
+
+# Columns added after the initial schema. create_all won't add them to tables
+# that already exist, so create_tables adds any that are missing.
+_ADDED_COLUMNS = {
+    "sessions": {"is_favorite": "BOOLEAN NOT NULL DEFAULT false"},
+    "messages": {
+        "updated_at": "TIMESTAMP WITH TIME ZONE",
+        "is_offloaded": "BOOLEAN NOT NULL DEFAULT false",
+        "content_size": "INTEGER",
+    },
+    "artifacts": {
+        "last_accessed_at": "TIMESTAMP WITH TIME ZONE",
+        "pinned": "BOOLEAN NOT NULL DEFAULT false",
+    },
+}
+
+
+async def create_tables() -> bool:
+    """Create or migrate the schema. Returns True when offloaded messages need reindexing for search."""
     _init_engine()
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
-        if not _is_sqlite:
-            # Add column if missing for pre-existing Postgres DBs (SQLite gets it via create_all)
-            try:
-                await conn.execute(text(
-                    "ALTER TABLE sessions ADD COLUMN IF NOT EXISTS is_favorite BOOLEAN NOT NULL DEFAULT false"
-                ))
-            except Exception:
-                pass
+        await conn.run_sync(_add_missing_columns)
+        # create_all skips indexes on tables that already exist
+        await conn.run_sync(_create_missing_indexes)
+        return await conn.run_sync(create_search_index)
+
+
+def _add_missing_columns(sync_conn):
+    inspector = inspect(sync_conn)
+    for table, columns in _ADDED_COLUMNS.items():
+        existing = {c["name"] for c in inspector.get_columns(table)}
+        for name, ddl in columns.items():
+            if name not in existing:
+                sync_conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {ddl}"))
+
+
+def _create_missing_indexes(sync_conn):
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(sync_conn, checkfirst=True)
 
 
 def get_async_session():
@@ -1,14 +1,30 @@
 """Download and update Austin 311 data with delta merge support."""
 
+import json
 import os
 import urllib.parse
-from datetime import datetime
+from datetime import datetime, timezone
 from pathlib import Path
 
 import pandas as pd
 
+from agent311 import anomalies, resolution, snapshot
+
 API_URL = "https://data.austintexas.gov/resource/xwdj-i9he.csv"
 LIMIT = 100000
+PROFILE_FILENAME = "311_profile.json"
+PROFILE_TOP_N = 10
+# Columns whose most common values are worth listing in the profile.
+CATEGORICAL_COLUMNS = [
+    "sr_type_desc",
+    "sr_department_desc",
+    "sr_method_received_desc",
+    "sr_status_desc",
+    "sr_location_city",
+    "sr_location_zip_code",
+    "sr_location_county",
+    "sr_location_council_district",
+]
 
 
 def get_data_dir() -> Path:
@@ -41,6 +57,43 @@ def download(where_clause: str, label: str = "") -> pd.DataFrame:
     return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
 
 
+def build_profile(df: pd.DataFrame) -> dict:
+    """Summarize the snapshot: row count, date ranges, null rates, cardinalities and top values."""
+    columns = {}
+    for name in df.columns:
+        col = df[name]
+        if pd.api.types.is_float_dtype(col) and (col.dropna() % 1 == 0).all():
+            col = col.astype("Int64")  # zip codes and districts, not 78701.0
+        info = {
+            "nullRate": round(float(col.isna().mean()), 4) if len(df) else 0.0,
+            "distinct": int(col.nunique(dropna=True)),
+        }
+        if name.endswith("_date"):
+            # Socrata timestamps are ISO strings, so string order is time order.
+            values = col.dropna().astype(str)
+            if not values.empty:
+                info["min"] = values.min()
+                info["max"] = values.max()
+        if name in CATEGORICAL_COLUMNS:
+            top = col.dropna().astype(str).value_counts().head(PROFILE_TOP_N)
+            info["top"] = [[value, int(count)] for value, count in top.items()]
+        columns[name] = info
+
+    return {
+        "rows": len(df),
+        "refreshedAt": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "columns": columns,
+    }
+
+
+def write_profile(df: pd.DataFrame, data_dir: Path) -> Path:
+    path = data_dir / PROFILE_FILENAME
+    tmp = path.with_suffix(".json.tmp")
+    tmp.write_text(json.dumps(build_profile(df), indent=1))
+    os.replace(tmp, path)
+    return path
+
+
 def main():
     data_dir = get_data_dir()
     data_dir.mkdir(parents=True, exist_ok=True)
@@ -58,28 +111,57 @@ def main():
 
         if pd.isna(latest):
             print("Cannot determine latest date, re-downloading...")
-            df = download(f"sr_created_date>='{start_date}'", "full")
-            df.to_csv(csv_path, index=False)
-            print(f"Downloaded {len(df)} rows")
+            current = download(f"sr_created_date>='{start_date}'", "full")
+            current.to_csv(csv_path, index=False)
+            changed = current
+            previous = None
+            print(f"Downloaded {len(current)} rows")
         else:
             print(f"Latest existing record: {latest}")
             delta = download(f"sr_created_date>'{latest}'", "delta")
-            if delta.empty:
-                print("No new records since last update.")
+            # Rows we already have that were closed or otherwise updated since the last run
+            frames = [delta]
+            latest_update = existing["sr_updated_date"].dropna().max() if "sr_updated_date" in existing else None
+            if latest_update is not None and not pd.isna(latest_update):
+                frames.append(download(
+                    f"sr_updated_date>'{latest_update}' AND sr_created_date>='{start_date}' "
+                    f"AND sr_created_date<='{latest}'",
+                    "updates",
+                ))
+            frames = [f for f in frames if not f.empty]
+            changed = pd.concat(frames) if frames else delta
+            previous = existing["sr_number"]
+            if changed.empty:
+                print("No new or updated records since last update.")
+                current = existing
             else:
-                merged = pd.concat([delta, existing]).drop_duplicates(
+                merged = pd.concat([changed, existing]).drop_duplicates(
                     subset="sr_number", keep="first"
                 )
                 merged = merged.sort_values("sr_created_date", ascending=False)
                 merged.to_csv(csv_path, index=False)
                 new_count = len(merged) - len(existing)
-                print(f"Added {new_count} new rows -> {len(merged)} total")
+                print(f"Added {new_count} new and refreshed {len(changed) - new_count} updated rows -> {len(merged)} total")
+                current = merged
     else:
         # Full download from Jan 1 of last year
         print(f"Downloading since {start_date}...")
-        df = download(f"sr_created_date>='{start_date}'", "full")
-        df.to_csv(csv_path, index=False)
-        print(f"Downloaded {len(df)} rows")
+        current = download(f"sr_created_date>='{start_date}'", "full")
+        current.to_csv(csv_path, index=False)
+        changed = current
+        previous = None
+        print(f"Downloaded {len(current)} rows")
+
+    print(f"Wrote dataset profile: {write_profile(current, data_dir)}")
+    print(f"Published snapshot: {snapshot.publish(current, data_dir / 'snapshot')}")
+    state_paths = [data_dir / resolution.STATE_FILENAME, data_dir / anomalies.STATE_FILENAME]
+    if changed.empty and all(p.exists() for p in state_paths):
+        print("Resolution-time and anomaly state already current")
+        return
+    state = resolution.update(data_dir, changed, current, previous)
+    print(f"Updated resolution-time sketches: {len(state.sketches)} keys, {len(state.open)} open requests")
+    flags = anomalies.update(data_dir, changed, current)
+    print(f"Scored daily counts through {flags.scored_through}: {len(flags.flags)} anomalies on record")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,184 @@
+"""Streaming, filtered exports of the dataset snapshot.
+
+Rows are filtered and encoded EXPORT_CHUNK_ROWS at a time, directly from the
+memory-mapped columns, so memory stays flat however many rows match:
+
+- Filters are matched against dictionary codes (one lookup per category), not against strings.
+- Each chunk becomes CSV, NDJSON or a Parquet row group, and is optionally gzipped.
+- Parquet is offered only when pyarrow is installed. It uses Parquet's own gzip codec instead of wrapping the file.
+"""
+
+import io
+import os
+import zlib
+from collections.abc import Iterator
+from datetime import datetime
+
+import numpy as np
+
+from agent311.snapshot import Snapshot
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # optional: parquet exports are disabled without it
+    pa = pq = None
+
+EXPORT_CHUNK_ROWS = int(os.environ.get("EXPORT_CHUNK_ROWS", "50000"))
+DATE_FORMAT = "%Y-%m-%dT%H:%M:%S.000"  # same as the Socrata CSV
+
+MEDIA_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet",
+}
+# Category filters: query parameter -> column
+CATEGORY_FILTERS = {
+    "type": "sr_type_desc",
+    "department": "sr_department_desc",
+    "status": "sr_status_desc",
+}
+
+
+class ExportError(ValueError):
+    pass
+
+
+def formats() -> list[str]:
+    return [f for f in MEDIA_TYPES if f != "parquet" or pq is not None]
+
+
+class _Sink(io.RawIOBase):
+    """Write-only file that hands its bytes over on drain(), for ParquetWriter."""
+
+    def __init__(self):
+        self._parts: list[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._parts.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data, self._parts = b"".join(self._parts), []
+        return data
+
+
+class Export:
+    """A validated export request. Iterate `chunks()` for the encoded body."""
+
+    def __init__(self, snapshot: Snapshot, fmt: str = "csv", columns: list[str] | None = None,
+                 filters: dict[str, str | None] | None = None, since: str | None = None,
+                 until: str | None = None, district: str | None = None, open_only: bool = False,
+                 compress: bool = False):
+        if fmt not in formats():
+            raise ExportError(f"Unsupported format '{fmt}'. Available: {', '.join(formats())}")
+        unknown = [c for c in columns or [] if c not in snapshot.kinds]
+        if unknown:
+            raise ExportError(f"Unknown columns: {', '.join(unknown)}")
+        self.snapshot = snapshot
+        self.format = fmt
+        self.columns = columns or snapshot.columns
+        # Parquet compresses internally; other formats are wrapped in gzip.
+        self.compress = compress and fmt != "parquet"
+        self._parquet_codec = "gzip" if compress else "snappy"
+
+        # column -> allowed dictionary codes
+        self._codes: dict[str, np.ndarray] = {}
+        for param, value in (filters or {}).items():
+            if value:
+                column = CATEGORY_FILTERS[param]
+                values = snapshot.categories(column)
+                self._codes[column] = np.flatnonzero(np.char.lower(values.astype(str)) == value.strip().lower())
+        self._since = self._parse_date(since, "since")
+        self._until = self._parse_date(until, "until")
+        self._district = None
+        if district:
+            try:
+                self._district = float(district)
+            except ValueError:
+                raise ExportError("district must be a number")
+        self._open_only = open_only
+
+    @staticmethod
+    def _parse_date(value: str | None, name: str) -> np.datetime64 | None:
+        if not value:
+            return None
+        try:
+            return np.datetime64(datetime.fromisoformat(value), "s")
+        except ValueError:
+            raise ExportError(f"{name} must be an ISO date, e.g. 2025-06-01")
+
+    @property
+    def media_type(self) -> str:
+        return "application/gzip" if self.compress else MEDIA_TYPES[self.format]
+
+    def filename(self) -> str:
+        name = f"311-export-{self.snapshot.version}.{self.format}"
+        return name + ".gz" if self.compress else name
+
+    def _matching(self, start: int, stop: int) -> np.ndarray:
+        """Row indices in [start, stop) that pass every filter."""
+        mask = np.ones(stop - start, dtype=bool)
+        for column, codes in self._codes.items():
+            mask &= np.isin(self.snapshot.array(column)[start:stop], codes)
+        if self._since is not None or self._until is not None:
+            created = self.snapshot.array("sr_created_date")[start:stop]
+            if self._since is not None:
+                mask &= created >= self._since
+            if self._until is not None:
+                mask &= created < self._until
+        if self._district is not None:
+            mask &= self.snapshot.array("sr_location_council_district")[start:stop] == self._district
+        if self._open_only:
+            mask &= np.isnat(self.snapshot.array("sr_closed_date")[start:stop])
+        return start + np.flatnonzero(mask)
+
+    def count(self) -> int:
+        return sum(
+            len(self._matching(start, min(start + EXPORT_CHUNK_ROWS, self.snapshot.rows)))
+            for start in range(0, self.snapshot.rows, EXPORT_CHUNK_ROWS)
+        )
+
+    def _encoded(self) -> Iterator[bytes]:
+        writer = None
+        sink = _Sink()
+        header = True
+        for start in range(0, self.snapshot.rows, EXPORT_CHUNK_ROWS):
+            rows = self._matching(start, min(start + EXPORT_CHUNK_ROWS, self.snapshot.rows))
+            if len(rows) == 0:
+                continue
+            frame = self.snapshot.frame(self.columns, rows)
+            if self.format == "csv":
+                yield frame.to_csv(index=False, header=header, date_format=DATE_FORMAT).encode("utf-8")
+                header = False
+            elif self.format == "ndjson":
+                lines = frame.to_json(orient="records", lines=True, date_format="iso", date_unit="ms")
+                yield (lines if lines.endswith("\n") else lines + "\n").encode("utf-8")
+            else:
+                table = pa.Table.from_pandas(frame, preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(sink, table.schema, compression=self._parquet_codec)
+                writer.write_table(table)
+                yield sink.drain()
+        if self.format == "csv" and header:
+            yield (",".join(self.columns) + "\n").encode("utf-8")
+        if self.format == "parquet":
+            if writer is None:
+                empty = self.snapshot.frame(self.columns, np.arange(0))
+                writer = pq.ParquetWriter(sink, pa.Table.from_pandas(empty, preserve_index=False).schema)
+            writer.close()
+            yield sink.drain()
+
+    def chunks(self) -> Iterator[bytes]:
+        if not self.compress:
+            yield from self._encoded()
+            return
+        gz = zlib.compressobj(6, zlib.DEFLATED, 31)
+        for chunk in self._encoded():
+            out = gz.compress(chunk)
+            if out:
+                yield out
+        yield gz.flush()
@@ -0,0 +1,168 @@
+"""Async file service for host tools and file endpoints.
+
+Disk work runs on a dedicated, bounded thread pool (FILEIO_THREADS) rather than
+on the event loop, so saving or previewing a large artifact doesn't stall other
+users' SSE streams. Writes go to a temp file that is renamed into place, so
+readers never see a partial file. `LoopLagMonitor` measures how late the event
+loop wakes up, which is exported through /api/metrics.
+"""
+
+import asyncio
+import hashlib
+import os
+import statistics
+import tempfile
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from pathlib import Path
+
+FILEIO_THREADS = int(os.environ.get("FILEIO_THREADS", "8"))
+PATH_CACHE_SIZE = int(os.environ.get("PATH_CACHE_SIZE", "1024"))
+PATH_CACHE_TTL_SECONDS = float(os.environ.get("PATH_CACHE_TTL_SECONDS", "30"))
+LOOP_LAG_INTERVAL_MS = int(os.environ.get("LOOP_LAG_INTERVAL_MS", "250"))
+# Wake-ups later than this count as a stall.
+LOOP_LAG_STALL_MS = int(os.environ.get("LOOP_LAG_STALL_MS", "100"))
+
+_executor = ThreadPoolExecutor(max_workers=FILEIO_THREADS, thread_name_prefix="fileio")
+_in_flight = 0
+_completed = 0
+
+# normalized path string -> (resolved path, monotonic expiry)
+_resolved: OrderedDict[str, tuple[Path, float]] = OrderedDict()
+_resolve_hits = 0
+_resolve_misses = 0
+
+
+async def run(func, *args, **kwargs):
+    """Run a blocking call on the file I/O pool."""
+    global _in_flight, _completed
+    _in_flight += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_executor, partial(func, *args, **kwargs))
+    finally:
+        _in_flight -= 1
+        _completed += 1
+
+
+async def stat(path: Path) -> os.stat_result:
+    return await run(os.stat, path)
+
+
+async def read_bytes(path: Path) -> bytes:
+    return await run(Path(path).read_bytes)
+
+
+async def read_text(path: Path, encoding: str = "utf-8", errors: str = "replace") -> str:
+    return await run(Path(path).read_text, encoding=encoding, errors=errors)
+
+
+def _write_atomic(path: Path, data: bytes) -> str:
+    fd, tmp_name = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_name, path)
+    except BaseException:
+        Path(tmp_name).unlink(missing_ok=True)
+        raise
+    return hashlib.sha256(data).hexdigest()
+
+
+async def write_atomic(path: Path, data: bytes) -> str:
+    """Write data to path via temp file and rename. Returns its sha256."""
+    return await run(_write_atomic, Path(path), data)
+
+
+async def resolve(path_value: str) -> Path:
+    """Resolve a path (strict), caching successful lookups for PATH_CACHE_TTL_SECONDS.
+
+    Callers still stat the result, so a file deleted since it was cached is
+    reported as missing rather than served stale.
+    """
+    global _resolve_hits, _resolve_misses
+    now = time.monotonic()
+    cached = _resolved.get(path_value)
+    if cached is not None and cached[1] > now:
+        _resolved.move_to_end(path_value)
+        _resolve_hits += 1
+        return cached[0]
+
+    _resolve_misses += 1
+    resolved = await run(lambda: Path(path_value).expanduser().resolve(strict=True))
+    _resolved[path_value] = (resolved, now + PATH_CACHE_TTL_SECONDS)
+    _resolved.move_to_end(path_value)
+    while len(_resolved) > PATH_CACHE_SIZE:
+        _resolved.popitem(last=False)
+    return resolved
+
+
+def forget(path: Path | str):
+    """Drop cached resolutions that point at path (after a rename or delete)."""
+    target = Path(path)
+    for key in [k for k, (p, _) in _resolved.items() if p == target or k == str(path)]:
+        del _resolved[key]
+
+
+def stats() -> dict:
+    return {
+        "threads": FILEIO_THREADS,
+        "inFlight": _in_flight,
+        "completed": _completed,
+        "pathCacheSize": len(_resolved),
+        "pathCacheHits": _resolve_hits,
+        "pathCacheMisses": _resolve_misses,
+    }
+
+
+class LoopLagMonitor:
+    """Samples event-loop lag: how much later than scheduled a sleep wakes up."""
+
+    def __init__(self, interval_ms: int = LOOP_LAG_INTERVAL_MS, window: int = 240):
+        self.interval = interval_ms / 1000
+        self._samples: deque[float] = deque(maxlen=window)
+        self._task: asyncio.Task | None = None
+        self._max_ms = 0.0
+        self._stalls = 0
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            scheduled = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag_ms = max(0.0, (loop.time() - scheduled) * 1000)
+            self._samples.append(lag_ms)
+            self._max_ms = max(self._max_ms, lag_ms)
+            if lag_ms > LOOP_LAG_STALL_MS:
+                self._stalls += 1
+
+    def stats(self) -> dict:
+        samples = sorted(self._samples)
+        if not samples:
+            return {"samples": 0, "stalls": self._stalls, "maxLagMs": round(self._max_ms, 1)}
+        return {
+            "samples": len(samples),
+            "lastLagMs": round(self._samples[-1], 1),
+            "p50LagMs": round(statistics.median(samples), 1),
+            "p99LagMs": round(samples[min(len(samples) - 1, int(len(samples) * 0.99))], 1),
+            "maxLagMs": round(self._max_ms, 1),
+            "stalls": self._stalls,
+            "stallThresholdMs": LOOP_LAG_STALL_MS,
+        }
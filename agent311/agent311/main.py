@@ -1,11 +1,14 @@
 import asyncio
 import base64
+import contextvars
 import json
 import logging
 import os
+import stat
 import uuid
 from contextlib import asynccontextmanager
 from datetime import datetime, timezone
+from email.utils import formatdate, parsedate_to_datetime
 from pathlib import Path
 
 logging.basicConfig(level=logging.INFO)
@@ -20,26 +23,37 @@ from claude_agent_sdk import (
     create_sdk_mcp_server,
     tool,
 )
-from fastapi import Depends, FastAPI, HTTPException, Query, Request, UploadFile, File
+from fastapi import Depends, FastAPI, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import FileResponse, Response, StreamingResponse
 from pydantic import BaseModel
-from sqlalchemy import select
+from sqlalchemy import and_, or_, select
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import selectinload
 
+from agent311 import anomalies, artifacts, coordination, fileio, previews, resolution, snapshot, uploads
 from agent311.auth import (
+    create_link_token,
     create_token,
     get_current_user,
+    get_optional_user,
     verify_credentials,
+    verify_link_token,
 )
 from agent311.db import (
+    STREAM_OPTIONS,
     Message,
     Session,
     create_tables,
-    get_async_session,
+    dispose_engines,
     get_db,
 )
+from agent311.download_311 import PROFILE_FILENAME
+from agent311.export import CATEGORY_FILTERS, Export, ExportError, formats
+from agent311.message_store import load_full_contents, reindex_offloaded, set_content, storage_stats
+from agent311.persistence import PersistenceWriter
+from agent311.search import search_messages
+from agent311.socrata import SOCRATA_RESULT_CHARS, SocrataClient, SocrataError, count_rows
+from agent311.storage import StorageManager
 
 
 _volume_mount = os.environ.get(
@@ -49,16 +63,43 @@ _volume_mount = os.environ.get(
 REPORTS_DIR = Path(_volume_mount) / "reports"
 CHARTS_DIR = Path(_volume_mount) / "analysis" / "charts"
 
+persistence = PersistenceWriter()
+loop_lag = fileio.LoopLagMonitor()
+# With WEB_CONCURRENCY > 1 every worker runs this module; singleton jobs go to the leader.
+leader = coordination.LeaderElection()
+storage = StorageManager(leader=leader)
+socrata = SocrataClient()
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    await create_tables()
-    logger.info("Database tables created")
-    REPORTS_DIR.mkdir(parents=True, exist_ok=True)
-    logger.info(f"Reports directory ready: {REPORTS_DIR}")
-    CHARTS_DIR.mkdir(parents=True, exist_ok=True)
-    logger.info(f"Charts directory ready: {CHARTS_DIR}")
+    # Workers start together; one at a time migrates the schema and reconciles the index.
+    async with coordination.startup_lock():
+        if await create_tables():
+            logger.info(f"Search index rebuilt; reindexed {await reindex_offloaded()} offloaded messages")
+        logger.info("Database tables created")
+        REPORTS_DIR.mkdir(parents=True, exist_ok=True)
+        logger.info(f"Reports directory ready: {REPORTS_DIR}")
+        CHARTS_DIR.mkdir(parents=True, exist_ok=True)
+        logger.info(f"Charts directory ready: {CHARTS_DIR}")
+        summary = await artifacts.reconcile(ARTIFACT_DIRS)
+        logger.info(f"Artifact index reconciled: {summary}")
+    current = await fileio.run(snapshot.current)
+    if current is not None:
+        logger.info(f"Dataset snapshot mapped: {current.stats()}")
+    await leader.start()
+    storage.start()
+    persistence.start()
+    logger.info("Persistence writer started")
+    loop_lag.start()
     yield
+    await loop_lag.stop()
+    await storage.close()
+    await leader.close()
+    await socrata.close()
+    await persistence.close()
+    logger.info(f"Persistence writer flushed: {persistence.stats()}")
+    await dispose_engines()
 
 
 app = FastAPI(lifespan=lifespan)
@@ -94,16 +135,24 @@ You can discuss:
 
 You have a local CSV file at {CSV_PATH} containing 311 service requests from January of last year to present, updated incrementally on each startup. Use the Read tool to access this file when users ask about recent 311 data. The CSV columns are: sr_number, sr_type_desc, sr_department_desc, sr_method_received_desc, sr_status_desc, sr_status_date, sr_created_date, sr_updated_date, sr_closed_date, sr_location, sr_location_street_number, sr_location_street_name, sr_location_city, sr_location_zip_code, sr_location_county, sr_location_x, sr_location_y, sr_location_lat, sr_location_long, sr_location_lat_long, sr_location_council_district, sr_location_map_page, sr_location_map_tile.
 
-For older data or complex queries, use the Socrata API: https://data.austintexas.gov/resource/xwdj-i9he.csv (or .json). Use $where, $limit, $order, $select, $group parameters.
+In Python scripts, load the data with `from agent311.snapshot import load_frame; df = load_frame(columns=[...])` instead of pd.read_csv. It memory-maps a shared columnar copy of the same CSV (dates already parsed, text columns categorical), so it loads instantly and uses little memory. Fall back to the CSV only if it raises.
+
+For response-time questions (median/p90/p99 hours to close, open backlog) by type, department, council district or month, call the resolution_times tool first; it answers instantly from precomputed sketches.
+
+For "is anything unusual" questions, call the anomalies tool first. It lists days whose request count per type, per council district, or overall was far above or below that weekday's usual level, as scored at each data refresh.
+
+When the user wants rows to download (e.g. "all open code-compliance requests in district 3 since June as CSV"), call export_data and give them the link it returns. Never build large exports yourself or pass them through save_report.
+
+For older data or complex queries, use the socrata_query tool instead of WebFetch. It runs SoQL (select, where, group, having, order, limit, offset) against the full dataset and caches results, so repeating a query is free.
 
 CRITICAL — CHART WORKFLOW (you MUST follow these steps exactly):
-1. Write a Python script to /tmp that uses pandas + plotly to analyze data and generate a chart
-2. The script must call fig.write_html('/tmp/chart_output.html', include_plotlyjs='cdn')
+1. Write a Python script to your scratch directory that uses pandas + plotly to analyze data and generate a chart
+2. The script must call fig.write_html('<scratch directory>/chart_output.html', include_plotlyjs='cdn')
 3. Run the script with Bash
-4. Read the HTML file content from /tmp/chart_output.html
+4. Read the HTML file content from <scratch directory>/chart_output.html
 5. Call save_chart with filename and the HTML content — save_chart returns the persistent path
-6. Call view_content with the EXACT path returned by save_chart (NOT /tmp)
-NEVER call view_content with a /tmp path. NEVER use Write tool for chart files. ALWAYS use save_chart.
+6. Call view_content with the EXACT path returned by save_chart (NOT the scratch directory)
+NEVER call view_content with a scratch or /tmp path. NEVER use Write tool for chart files. ALWAYS use save_chart.
 Chart style: template='plotly_dark', paper_bgcolor='#1a1a2e', plot_bgcolor='#16213e'.
 Filename convention: <descriptive-name>-chart-<YYYY-MM-DD>.html
 
@@ -111,6 +160,68 @@ REPORTS: Same as charts but use save_report instead. Wrap plotly chart divs in H
 
 Be helpful, accurate, and enthusiastic about Austin's civic data!"""
 
+PROFILE_PATH = Path(_volume_mount) / PROFILE_FILENAME
+# (profile file mtime_ns, rendered prompt section); re-rendered when the file changes.
+_profile_prompt: tuple[int, str] | None = None
+
+
+def _render_profile(profile: dict) -> str:
+    columns = profile.get("columns", {})
+    lines = [
+        f"DATASET PROFILE of {CSV_PATH} (refreshed {profile.get('refreshedAt', 'unknown')}). "
+        "Answer overview questions (size, date ranges, common types, districts) from this profile "
+        "without reading the file.",
+        f"- Rows: {profile.get('rows', 0):,}",
+    ]
+    for name, info in columns.items():
+        if "min" in info:
+            lines.append(f"- {name}: {info['min']} to {info['max']}")
+    lines.append("- Null rate / distinct values: " + "; ".join(
+        f"{name} {info['nullRate']:.0%}/{info['distinct']}" for name, info in columns.items()
+    ))
+    for name, info in columns.items():
+        if info.get("top"):
+            lines.append(f"- Top {name}: " + "; ".join(f"{value} ({count:,})" for value, count in info["top"]))
+    return "\n".join(lines)
+
+
+async def _dataset_profile_prompt() -> str:
+    """Profile section for the system prompt, or "" before the first ingest."""
+    global _profile_prompt
+    try:
+        st = await fileio.stat(PROFILE_PATH)
+    except FileNotFoundError:
+        return ""
+    if _profile_prompt is None or _profile_prompt[0] != st.st_mtime_ns:
+        try:
+            profile = json.loads(await fileio.read_text(PROFILE_PATH))
+        except ValueError:
+            logger.warning(f"Ignoring unreadable dataset profile: {PROFILE_PATH}")
+            return ""
+        _profile_prompt = (st.st_mtime_ns, _render_profile(profile))
+    return _profile_prompt[1]
+
+
+RESOLUTION_PATH = Path(_volume_mount) / resolution.STATE_FILENAME
+ANOMALIES_PATH = Path(_volume_mount) / anomalies.STATE_FILENAME
+# state file -> (mtime_ns, loaded state); reloaded after each ingest rewrites the file.
+_ingest_states: dict[Path, tuple[int, object]] = {}
+
+
+async def _load_ingest_state(path: Path, load):
+    """State written by download_311 (resolution sketches, anomaly baselines), or None before the first ingest."""
+    try:
+        st = await fileio.stat(path)
+    except FileNotFoundError:
+        return None
+    cached = _ingest_states.get(path)
+    if cached is None or cached[0] != st.st_mtime_ns:
+        state = await fileio.run(load, path)
+        if state is None:
+            return None
+        cached = _ingest_states[path] = (st.st_mtime_ns, state)
+    return cached[1]
+
 VIEWABLE_EXTENSIONS = {
     ".html": "html",
     ".htm": "html",
@@ -130,17 +241,19 @@ def _normalize_path(path_value: str) -> str:
     return path_value.strip().strip('"').strip("'")
 
 
-def _load_viewable_file(path_value: str) -> dict:
+async def _resolve_viewable_file(path_value: str) -> tuple[Path, os.stat_result]:
+    """Validate a preview path: it must exist, be a viewable type and sit under an allowed root."""
     normalized = _normalize_path(path_value)
     if not normalized:
         raise ValueError("`path` is required.")
 
     try:
-        file_path = Path(normalized).expanduser().resolve(strict=True)
+        file_path = await fileio.resolve(normalized)
+        st = await fileio.stat(file_path)
     except FileNotFoundError as exc:
         raise FileNotFoundError(f"File not found: {normalized}") from exc
 
-    if not file_path.is_file():
+    if not stat.S_ISREG(st.st_mode):
         raise ValueError(f"Path is not a file: {file_path}")
 
     ext = file_path.suffix.lower()
@@ -154,23 +267,34 @@ def _load_viewable_file(path_value: str) -> dict:
             f"Path is outside allowed roots ({allowed_roots}): {file_path}"
         )
 
-    size_bytes = file_path.stat().st_size
+    location = _artifact_location(file_path)
+    if location is not None:
+        storage.touch(location[1])
+    return file_path, st
+
+
+async def _load_viewable_file(path_value: str) -> dict:
+    file_path, st = await _resolve_viewable_file(path_value)
+    size_bytes = st.st_size
     if size_bytes > MAX_VIEWABLE_BYTES:
         raise ValueError(
-            f"File is too large for preview ({size_bytes} bytes > {MAX_VIEWABLE_BYTES})."
+            f"File is too large for preview ({size_bytes} bytes > {MAX_VIEWABLE_BYTES}). "
+            "Request it in pages (offset/limit) or raw instead."
         )
 
+    ext = file_path.suffix.lower()
     result = {
         "path": str(file_path),
         "language": VIEWABLE_EXTENSIONS[ext],
         "sizeBytes": size_bytes,
     }
 
+    data = await previews.cache.read(file_path, st)
     if ext == ".png":
-        result["content"] = base64.b64encode(file_path.read_bytes()).decode("ascii")
+        result["content"] = base64.b64encode(data).decode("ascii")
         result["encoding"] = "base64"
     else:
-        result["content"] = file_path.read_text(encoding="utf-8", errors="replace")
+        result["content"] = data.decode("utf-8", errors="replace")
 
     return result
 
@@ -183,10 +307,10 @@ def _load_viewable_file(path_value: str) -> dict:
 async def view_content(args: dict):
     path_value = str(args.get("path", "")).strip()
     try:
-        file_info = _load_viewable_file(path_value)
+        file_path, st = await _resolve_viewable_file(path_value)
         text = (
-            f"Prepared artifact preview content for {file_info['path']} "
-            f"({file_info['language']}, {file_info['sizeBytes']} bytes)."
+            f"Prepared artifact preview content for {file_path} "
+            f"({VIEWABLE_EXTENSIONS[file_path.suffix.lower()]}, {st.st_size} bytes)."
         )
     except (FileNotFoundError, PermissionError, ValueError) as exc:
         text = f"Unable to prepare preview: {exc}"
@@ -196,6 +320,9 @@ async def view_content(args: dict):
 
 ALLOWED_REPORT_EXTENSIONS = {".html", ".png", ".csv", ".pdf"}
 ALLOWED_UPLOAD_EXTENSIONS = {".html", ".pdf"}
+MAX_UPLOAD_BYTES = int(os.environ.get("MAX_UPLOAD_BYTES", str(50 * 1024 * 1024)))
+# Room for multipart boundaries and part headers on top of the file itself.
+_MULTIPART_OVERHEAD_BYTES = 64 * 1024
 
 
 @tool(
@@ -224,16 +351,32 @@ async def save_report(args: dict):
     file_path = REPORTS_DIR / safe_name
 
     if encoding == "base64":
-        data = base64.b64decode(content)
-        file_path.write_bytes(data)
+        data = await fileio.run(base64.b64decode, content)
     else:
-        file_path.write_text(content, encoding="utf-8")
+        data = content.encode("utf-8")
+    sha256 = await fileio.write_atomic(file_path, data)
+    if ext == ".png":
+        await previews.create_thumbnail(file_path)
 
-    size = file_path.stat().st_size
-    return {"content": [{"type": "text", "text": f"Report saved ({size} bytes). Pass this path to view_content: {file_path}"}]}
+    # Agent output stays evictable until the user keeps it; overwriting keeps the pin.
+    artifact = await artifacts.record(file_path, "report", sha256=sha256)
+    return {"content": [{"type": "text", "text": f"Report saved ({artifact.size_bytes} bytes). Pass this path to view_content: {file_path}"}]}
 
 
 ALLOWED_CHART_EXTENSIONS = {".html", ".png"}
+ARTIFACT_DIRS = {
+    "report": (REPORTS_DIR, ALLOWED_REPORT_EXTENSIONS),
+    "chart": (CHARTS_DIR, ALLOWED_CHART_EXTENSIONS),
+}
+
+
+def _artifact_location(file_path: Path) -> tuple[str, Path] | None:
+    """(kind, index path) for a resolved file inside the reports or charts directory."""
+    for kind, (directory, _) in ARTIFACT_DIRS.items():
+        root = directory.resolve()
+        if file_path.is_relative_to(root):
+            return kind, directory / file_path.relative_to(root)
+    return None
 
 
 @tool(
@@ -261,18 +404,158 @@ async def save_chart(args: dict):
     file_path = CHARTS_DIR / safe_name
 
     if encoding == "base64":
-        data = base64.b64decode(content)
-        file_path.write_bytes(data)
+        data = await fileio.run(base64.b64decode, content)
     else:
-        file_path.write_text(content, encoding="utf-8")
+        data = content.encode("utf-8")
+    sha256 = await fileio.write_atomic(file_path, data)
+    if ext == ".png":
+        await previews.create_thumbnail(file_path)
 
-    size = file_path.stat().st_size
-    return {"content": [{"type": "text", "text": f"Chart saved ({size} bytes). Pass this path to view_content: {file_path}"}]}
+    artifact = await artifacts.record(file_path, "chart", sha256=sha256)
+    return {"content": [{"type": "text", "text": f"Chart saved ({artifact.size_bytes} bytes). Pass this path to view_content: {file_path}"}]}
+
+
+@tool(
+    "socrata_query",
+    "Run a SoQL query against the full Austin 311 dataset (2014-present) on Socrata. Returns CSV. Results are cached, so repeated queries are instant.",
+    {
+        "type": "object",
+        "properties": {
+            "select": {"type": "string", "description": "$select, e.g. sr_type_desc, count(*) AS n"},
+            "where": {"type": "string", "description": "$where, e.g. sr_created_date >= '2020-01-01'"},
+            "group": {"type": "string", "description": "$group"},
+            "having": {"type": "string", "description": "$having"},
+            "order": {"type": "string", "description": "$order, e.g. n DESC"},
+            "limit": {"type": "integer", "description": "$limit (default 1000)"},
+            "offset": {"type": "integer", "description": "$offset"},
+        },
+        "required": [],
+    },
+)
+async def socrata_query(args: dict):
+    try:
+        data, path, cached = await socrata.query(args)
+    except SocrataError as exc:
+        return {"content": [{"type": "text", "text": f"Error: {exc}"}]}
+
+    text = data.decode("utf-8", errors="replace")
+    rows = count_rows(text)
+    header = f"{rows} rows{' (cached)' if cached else ''}. Full CSV: {path}\n"
+    if len(text) > SOCRATA_RESULT_CHARS:
+        text = text[:text.rfind("\n", 0, SOCRATA_RESULT_CHARS) + 1]
+        text += f"... truncated; Read {path} for the remaining rows."
+    return {"content": [{"type": "text", "text": header + text}]}
+
+
+@tool(
+    "resolution_times",
+    "Resolution-time percentiles (p50/p90/p99 hours from created to closed) and open backlog for 311 requests in the local dataset. Omit a filter to include all values.",
+    {
+        "type": "object",
+        "properties": {
+            "type": {"type": "string", "description": "sr_type_desc, e.g. Loose Dog"},
+            "department": {"type": "string", "description": "sr_department_desc"},
+            "district": {"type": "string", "description": "Council district number, e.g. 9"},
+            "month": {"type": "string", "description": "Created month as YYYY-MM"},
+        },
+        "required": [],
+    },
+)
+async def resolution_times(args: dict):
+    state = await _load_ingest_state(RESOLUTION_PATH, resolution.load)
+    if state is None:
+        return {"content": [{"type": "text", "text": "Error: resolution statistics have not been built yet."}]}
+    summary = state.summary(args.get("type"), args.get("department"), args.get("district"), args.get("month"))
+    return {"content": [{"type": "text", "text": json.dumps(summary)}]}
+
+
+@tool(
+    "anomalies",
+    "Days with unusually high or low 311 request counts, per request type, council district or overall, compared with that weekday's baseline. Strongest first.",
+    {
+        "type": "object",
+        "properties": {
+            "days": {"type": "integer", "description": "Look back this many days (default 7)"},
+            "dimension": {"type": "string", "enum": ["type", "district", "all"]},
+            "value": {"type": "string", "description": "A request type or district number"},
+        },
+        "required": [],
+    },
+)
+async def anomalies_tool(args: dict):
+    state = await _load_ingest_state(ANOMALIES_PATH, anomalies.load)
+    if state is None:
+        return {"content": [{"type": "text", "text": "Error: anomaly baselines have not been built yet."}]}
+    result = state.query(int(args.get("days") or 7), args.get("dimension"), args.get("value"))
+    return {"content": [{"type": "text", "text": json.dumps(result)}]}
+
+
+# Absolute base for links handed to the agent; the frontend is served from another origin.
+_railway_domain = os.environ.get("RAILWAY_PUBLIC_DOMAIN")
+PUBLIC_API_URL = os.environ.get("PUBLIC_API_URL", f"https://{_railway_domain}" if _railway_domain else "").rstrip("/")
+# Without PUBLIC_API_URL, links use the origin the current /api/chat request came in on.
+_request_base_url: contextvars.ContextVar[str] = contextvars.ContextVar("request_base_url", default="")
+EXPORT_FILTER_SCHEMA = {
+    "type": {"type": "string", "description": "sr_type_desc (case-insensitive exact match)"},
+    "department": {"type": "string", "description": "sr_department_desc"},
+    "status": {"type": "string", "description": "sr_status_desc"},
+    "district": {"type": "string", "description": "Council district number"},
+    "since": {"type": "string", "description": "Created on or after (ISO date)"},
+    "until": {"type": "string", "description": "Created before (ISO date)"},
+    "open": {"type": "boolean", "description": "Only requests without a closed date"},
+}
+
+
+async def _build_export(params: dict) -> Export:
+    current = await fileio.run(snapshot.current)
+    if current is None:
+        raise HTTPException(status_code=503, detail="No dataset snapshot has been published yet")
+    columns = [c.strip() for c in (params.get("columns") or "").split(",") if c.strip()]
+    try:
+        return Export(
+            current,
+            fmt=params.get("format") or "csv",
+            columns=columns or None,
+            filters={name: params.get(name) for name in CATEGORY_FILTERS},
+            since=params.get("since"),
+            until=params.get("until"),
+            district=params.get("district"),
+            open_only=bool(params.get("open")),
+            compress=bool(params.get("gzip")),
+        )
+    except ExportError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+
+
+@tool(
+    "export_data",
+    f"Create a download link for filtered rows of the local 311 dataset ({', '.join(formats())}). The file is streamed to the user's browser; nothing is loaded into this conversation.",
+    {
+        "type": "object",
+        "properties": {
+            **EXPORT_FILTER_SCHEMA,
+            "format": {"type": "string", "enum": formats()},
+            "columns": {"type": "string", "description": "Comma-separated columns to include (default all)"},
+            "gzip": {"type": "boolean"},
+        },
+        "required": [],
+    },
+)
+async def export_data(args: dict):
+    params = {k: v for k, v in args.items() if v not in (None, "")}
+    try:
+        export = await _build_export(params)
+    except HTTPException as exc:
+        return {"content": [{"type": "text", "text": f"Error: {exc.detail}"}]}
+    rows = await fileio.run(export.count)
+    token = create_link_token("export", params)
+    url = f"{PUBLIC_API_URL or _request_base_url.get()}/api/data/export?token={token}"
+    return {"content": [{"type": "text", "text": f"{rows:,} matching rows as {export.filename()}. Download link (valid for an hour): {url}"}]}
 
 
 agent311_host_tools = create_sdk_mcp_server(
     name="agent311_host",
-    tools=[view_content, save_report, save_chart],
+    tools=[view_content, save_report, save_chart, socrata_query, resolution_times, anomalies_tool, export_data],
 )
 
 
@@ -315,7 +598,13 @@ async def _stream_chat(messages: list, session_id: str | None, user_msg_id: str
         if role and content and not content.startswith("Error:"):
             context += f"<{role}>\n{content}\n</{role}>\n\n"
 
+    scratch_dir = await storage.create_scratch_dir()
+    # Stable prefix first (prompt + profile) so it stays cacheable across turns.
     system_prompt = SYSTEM_PROMPT
+    profile = await _dataset_profile_prompt()
+    if profile:
+        system_prompt += f"\n\n{profile}"
+    system_prompt += f"\n\nYour scratch directory for this request is {scratch_dir}. It is deleted when you finish."
     if context:
         system_prompt += f"\n\nConversation history:\n{context}"
     logger.info(f"=== prompt: {prompt[:200]} ===")
@@ -338,9 +627,14 @@ async def _stream_chat(messages: list, session_id: str | None, user_msg_id: str
             "mcp__agent311_host__view_content",
             "mcp__agent311_host__save_report",
             "mcp__agent311_host__save_chart",
+            "mcp__agent311_host__socrata_query",
+            "mcp__agent311_host__resolution_times",
+            "mcp__agent311_host__anomalies",
+            "mcp__agent311_host__export_data",
         ],
         permission_mode="acceptEdits",
         max_turns=60,
+        env={"TMPDIR": str(scratch_dir)},
         stderr=lambda line: logger.warning(f"[claude-cli stderr] {line}"),
     )
 
@@ -394,6 +688,7 @@ async def _stream_chat(messages: list, session_id: str | None, user_msg_id: str
             await queue.put(f"data: {json.dumps({'type': 'text-delta', 'id': msg_id, 'delta': error_text})}\n\n")
         finally:
             logger.info("[agent] done")
+            await storage.remove_scratch_dir(scratch_dir)
             await queue.put(None)  # sentinel: agent done
 
     agent_task = asyncio.create_task(_run_agent())
@@ -424,29 +719,20 @@ async def _stream_chat(messages: list, session_id: str | None, user_msg_id: str
 
     await agent_task  # ensure any exceptions are propagated
 
-    yield f"data: {json.dumps({'type': 'text-end', 'id': msg_id})}\n\n"
-    yield f"data: {json.dumps({'type': 'finish'})}\n\n"
-    yield "data: [DONE]\n\n"
-
-    # Persist assistant message to DB after streaming completes
+    # Commit the assistant message before signalling the end of the stream: the
+    # frontend PATCHes it (appending previews) as soon as it sees [DONE], and
+    # that request may be served by another worker with its own queue.
     if session_id and full_text:
         try:
-            async with get_async_session()() as db:
-                db_msg = Message(
-                    id=assistant_msg_id or str(uuid.uuid4()),
-                    session_id=session_id,
-                    role="assistant",
-                    content=full_text,
-                )
-                db.add(db_msg)
-                # Update session timestamp
-                result = await db.execute(select(Session).where(Session.id == session_id))
-                sess = result.scalar_one_or_none()
-                if sess:
-                    sess.updated_at = datetime.now(timezone.utc)
-                await db.commit()
+            persistence.add_message(assistant_msg_id or str(uuid.uuid4()), session_id, "assistant", full_text)
+            persistence.touch_session(session_id)
+            await persistence.flush()
         except Exception:
-            logger.exception("Failed to save assistant message to DB")
+            logger.exception("Failed to persist assistant message")
+
+    yield f"data: {json.dumps({'type': 'text-end', 'id': msg_id})}\n\n"
+    yield f"data: {json.dumps({'type': 'finish'})}\n\n"
+    yield "data: [DONE]\n\n"
 
 
 # ─── Auth endpoint ───────────────────────────────────────────────────────────
@@ -478,57 +764,224 @@ class UpdateSessionRequest(BaseModel):
     is_favorite: bool | None = None
 
 
+def _encode_cursor(values: list) -> str:
+    raw = json.dumps(values, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def _decode_cursor(cursor: str, size: int) -> list:
+    """Decode an opaque cursor produced by `_encode_cursor`. Raises HTTP 400 if malformed."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except (ValueError, UnicodeError) as exc:
+        raise HTTPException(status_code=400, detail="Invalid cursor") from exc
+    if not isinstance(values, list) or len(values) != size:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return values
+
+
+def _as_utc(value: datetime) -> datetime:
+    """SQLite hands back naive datetimes (stored as UTC); Postgres returns aware ones."""
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+def _parse_cursor_datetime(value) -> datetime:
+    try:
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError) as exc:
+        raise HTTPException(status_code=400, detail="Invalid cursor") from exc
+
+
+SESSION_FIELDS = {
+    "id": Session.id,
+    "title": Session.title,
+    "createdAt": Session.created_at,
+    "updatedAt": Session.updated_at,
+    "isFavorite": Session.is_favorite,
+}
+
+
 @app.get("/api/sessions")
 async def list_sessions(
+    cursor: str | None = Query(None, description="Opaque cursor from a previous page's nextCursor"),
+    limit: int = Query(50, ge=1, le=200),
+    fields: str | None = Query(None, description="Comma-separated subset of session fields to return"),
     user: str = Depends(get_current_user),
     db: AsyncSession = Depends(get_db),
 ):
-    result = await db.execute(
-        select(Session).order_by(Session.is_favorite.desc(), Session.updated_at.desc())
+    if fields:
+        requested = [f.strip() for f in fields.split(",") if f.strip()]
+        unknown = [f for f in requested if f not in SESSION_FIELDS]
+        if unknown:
+            allowed = ", ".join(SESSION_FIELDS)
+            raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}. Allowed: {allowed}")
+    else:
+        requested = list(SESSION_FIELDS)
+
+    # Sort keys are always selected so the next cursor can be built from the last row.
+    sort_keys = [Session.is_favorite, Session.updated_at, Session.id]
+    columns = sort_keys + [SESSION_FIELDS[f] for f in requested if SESSION_FIELDS[f] not in sort_keys]
+    query = select(*columns).order_by(
+        Session.is_favorite.desc(), Session.updated_at.desc(), Session.id.desc()
     )
-    sessions = result.scalars().all()
-    return [
-        {
-            "id": s.id,
-            "title": s.title,
-            "createdAt": s.created_at.isoformat() if s.created_at else None,
-            "updatedAt": s.updated_at.isoformat() if s.updated_at else None,
-            "isFavorite": s.is_favorite,
-        }
-        for s in sessions
-    ]
+
+    if cursor:
+        fav, updated, last_id = _decode_cursor(cursor, 3)
+        fav = bool(fav)
+        updated = _parse_cursor_datetime(updated)
+        after_cursor = [
+            and_(Session.is_favorite == fav, Session.updated_at < updated),
+            and_(Session.is_favorite == fav, Session.updated_at == updated, Session.id < last_id),
+        ]
+        if fav:
+            # Favorites sort first, so every non-favorite comes after a favorite cursor.
+            after_cursor.append(Session.is_favorite == False)  # noqa: E712
+        query = query.where(or_(*after_cursor))
+
+    result = await db.execute(query.limit(limit + 1))
+    rows = result.mappings().all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    sessions = []
+    for row in rows:
+        item = {}
+        for field in requested:
+            value = row[SESSION_FIELDS[field].key]
+            item[field] = value.isoformat() if isinstance(value, datetime) else value
+        sessions.append(item)
+
+    next_cursor = None
+    if has_more:
+        last = rows[-1]
+        next_cursor = _encode_cursor([last["is_favorite"], last["updated_at"].isoformat(), last["id"]])
+    return {"sessions": sessions, "nextCursor": next_cursor}
+
+
+def _message_to_dict(m: Message, content: str | None = None) -> dict:
+    """Serialize a message. Without `content`, offloaded messages carry only their excerpt."""
+    return {
+        "id": m.id,
+        "role": m.role,
+        "content": content if content is not None else m.content,
+        "truncated": content is None and bool(m.is_offloaded),
+        "createdAt": m.created_at.isoformat() if m.created_at else None,
+        "updatedAt": m.updated_at.isoformat() if m.updated_at else None,
+    }
 
 
 @app.get("/api/sessions/{session_id}")
 async def get_session(
     session_id: str,
+    include_messages: bool = Query(True, description="Set false to fetch metadata only and page messages separately"),
     user: str = Depends(get_current_user),
     db: AsyncSession = Depends(get_db),
 ):
-    result = await db.execute(
-        select(Session)
-        .options(selectinload(Session.messages))
-        .where(Session.id == session_id)
-    )
+    result = await db.execute(select(Session).where(Session.id == session_id))
     session = result.scalar_one_or_none()
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
-    return {
+    data = {
         "id": session.id,
         "title": session.title,
         "createdAt": session.created_at.isoformat() if session.created_at else None,
         "updatedAt": session.updated_at.isoformat() if session.updated_at else None,
         "isFavorite": session.is_favorite,
-        "messages": [
-            {
-                "id": m.id,
-                "role": m.role,
-                "content": m.content,
-                "createdAt": m.created_at.isoformat() if m.created_at else None,
-            }
-            for m in session.messages
-        ],
     }
+    if include_messages:
+        # Long histories are streamed from a server-side cursor rather than buffered.
+        rows = await db.stream_scalars(
+            select(Message).where(Message.session_id == session_id).order_by(Message.created_at),
+            execution_options=STREAM_OPTIONS,
+        )
+        messages = [m async for m in rows]
+        contents = await load_full_contents(db, messages)
+        data["messages"] = [_message_to_dict(m, contents[m.id]) for m in messages]
+    return data
+
+
+@app.get("/api/sessions/{session_id}/messages")
+async def list_session_messages(
+    session_id: str,
+    cursor: str | None = Query(None, description="Opaque cursor from a previous page's nextCursor"),
+    direction: str = Query("before", pattern="^(before|after)$", description="Page toward older (before) or newer (after) messages"),
+    limit: int = Query(50, ge=1, le=200),
+    since: str | None = Query(None, description="ISO timestamp or message id; return only messages created or edited after it"),
+    preview: bool = Query(False, description="Return stored excerpts of large messages instead of their full content"),
+    user: str = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """Page through a session's messages in chronological order.
+
+    Without a cursor, direction=before returns the newest page and direction=after
+    the oldest. With `since`, only messages created or edited after that point are
+    returned (oldest first), so the frontend can sync incrementally.
+    """
+    exists = await db.execute(select(Session.id).where(Session.id == session_id))
+    if exists.scalar_one_or_none() is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+
+    query = select(Message).where(Message.session_id == session_id)
+
+    since_at = None
+    if since:
+        try:
+            since_at = _as_utc(datetime.fromisoformat(since))
+        except ValueError:
+            anchor = await db.execute(
+                select(Message.created_at).where(Message.id == since, Message.session_id == session_id)
+            )
+            since_at = anchor.scalar_one_or_none()
+            if since_at is None:
+                raise HTTPException(status_code=400, detail=f"`since` is neither a timestamp nor a message id in this session: {since}")
+            since_at = _as_utc(since_at)
+        query = query.where(or_(Message.created_at > since_at, Message.updated_at > since_at))
+        direction = "after"
+
+    if cursor:
+        created, last_id = _decode_cursor(cursor, 2)
+        created = _parse_cursor_datetime(created)
+        if direction == "before":
+            query = query.where(or_(
+                Message.created_at < created,
+                and_(Message.created_at == created, Message.id < last_id),
+            ))
+        else:
+            query = query.where(or_(
+                Message.created_at > created,
+                and_(Message.created_at == created, Message.id > last_id),
+            ))
+
+    if direction == "before":
+        query = query.order_by(Message.created_at.desc(), Message.id.desc())
+    else:
+        query = query.order_by(Message.created_at, Message.id)
+
+    result = await db.execute(query.limit(limit + 1))
+    messages = list(result.scalars().all())
+    has_more = len(messages) > limit
+    messages = messages[:limit]
+    if direction == "before":
+        messages.reverse()
+
+    next_cursor = None
+    if has_more:
+        edge = messages[0] if direction == "before" else messages[-1]
+        next_cursor = _encode_cursor([edge.created_at.isoformat(), edge.id])
+
+    contents = {} if preview else await load_full_contents(db, messages)
+    data = {
+        "messages": [_message_to_dict(m, contents.get(m.id)) for m in messages],
+        "nextCursor": next_cursor,
+    }
+    if since_at is not None:
+        # High-water mark to pass as `since` on the next incremental sync.
+        seen = [_as_utc(m.updated_at or m.created_at) for m in messages]
+        data["syncedAt"] = max(seen + [since_at]).isoformat()
+    return data
 
 
 @app.post("/api/sessions")
@@ -570,6 +1023,20 @@ async def update_session(
     return {"ok": True}
 
 
+@app.get("/api/messages/{message_id}")
+async def get_message(
+    message_id: str,
+    user: str = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    result = await db.execute(select(Message).where(Message.id == message_id))
+    message = result.scalar_one_or_none()
+    if not message:
+        raise HTTPException(status_code=404, detail="Message not found")
+    contents = await load_full_contents(db, [message])
+    return _message_to_dict(message, contents[message.id])
+
+
 @app.patch("/api/messages/{message_id}")
 async def update_message(
     message_id: str,
@@ -582,7 +1049,8 @@ async def update_message(
     if not message:
         raise HTTPException(status_code=404, detail="Message not found")
     if "content" in body:
-        message.content = body["content"]
+        await set_content(db, message, body["content"])
+        message.updated_at = datetime.now(timezone.utc)
     await db.commit()
     return {"ok": True}
 
@@ -602,28 +1070,57 @@ async def delete_session(
     return {"ok": True}
 
 
+@app.get("/api/search")
+async def search(
+    q: str = Query(..., min_length=1, description="Search text"),
+    session_id: str | None = Query(None, description="Restrict results to one session"),
+    cursor: str | None = Query(None, description="Opaque cursor from a previous page's nextCursor"),
+    limit: int = Query(20, ge=1, le=100),
+    user: str = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    offset = 0
+    if cursor:
+        (offset,) = _decode_cursor(cursor, 1)
+        if not isinstance(offset, int) or offset < 0:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    hits = await search_messages(db, q, limit + 1, offset, session_id)
+    next_cursor = _encode_cursor([offset + limit]) if len(hits) > limit else None
+    return {"results": hits[:limit], "nextCursor": next_cursor}
+
+
 # ─── Reports endpoint ───────────────────────────────────────────────────────
 
 
 @app.get("/api/reports")
-async def list_reports(user: str = Depends(get_current_user)):
-    if not REPORTS_DIR.exists():
-        return {"files": []}
-
-    files = []
-    for f in REPORTS_DIR.iterdir():
-        if f.is_file() and f.suffix.lower() in ALLOWED_REPORT_EXTENSIONS:
-            stat = f.stat()
-            files.append({
-                "name": f.name,
-                "path": str(f),
-                "type": f.suffix.lstrip(".").lower(),
-                "sizeBytes": stat.st_size,
-                "modifiedAt": datetime.fromtimestamp(stat.st_mtime, tz=timezone.utc).isoformat(),
-            })
-
-    files.sort(key=lambda x: x["modifiedAt"], reverse=True)
-    return {"files": files}
+async def list_reports(
+    kind: str = Query("report", pattern="^(report|chart|all)$", description="Artifact kind to list"),
+    type: str | None = Query(None, description="File type filter, e.g. html or pdf"),
+    q: str | None = Query(None, description="Case-insensitive filename filter"),
+    sort: str = Query("modified", pattern="^(modified|name|size)$"),
+    cursor: str | None = Query(None, description="Opaque cursor from a previous page's nextCursor"),
+    limit: int = Query(100, ge=1, le=500),
+    user: str = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    after = None
+    if cursor:
+        after = _decode_cursor(cursor, 2)
+        if sort == "modified":
+            _parse_cursor_datetime(after[0])
+
+    rows = await artifacts.list_artifacts(
+        db,
+        sort=sort,
+        kind=None if kind == "all" else kind,
+        type=type,
+        q=q,
+        after=after,
+        limit=limit + 1,
+    )
+    next_cursor = _encode_cursor(artifacts.sort_key(rows[limit - 1], sort)) if len(rows) > limit else None
+    return {"files": [artifacts.artifact_to_dict(a) for a in rows[:limit]], "nextCursor": next_cursor}
 
 
 DOWNLOAD_MEDIA_TYPES = {
@@ -635,57 +1132,113 @@ DOWNLOAD_MEDIA_TYPES = {
 }
 
 
+# Responses requested with ?v=<sha256> never change, so browsers may keep them indefinitely.
+IMMUTABLE_CACHE_CONTROL = "private, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "private, no-cache"
+
+
+def _not_modified(request: Request, etag: str, mtime: float) -> bool:
+    """Evaluate If-None-Match (preferred) or If-Modified-Since against the file."""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [t.strip().removeprefix("W/") for t in if_none_match.split(",")]
+        return "*" in tags or etag in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        return int(mtime) <= since.timestamp()
+    return False
+
+
 @app.get("/api/reports/download")
 async def download_report(
+    request: Request,
     path: str = Query(..., description="Absolute path to report file"),
     inline: bool = Query(False, description="Serve inline instead of as attachment"),
+    v: str | None = Query(None, description="Content hash from the listing; pins the response for caching"),
     user: str = Depends(get_current_user),
 ):
     try:
-        file_path = Path(path).resolve(strict=True)
+        file_path = await fileio.resolve(path)
+        stat_result = await fileio.stat(file_path)
     except FileNotFoundError:
         raise HTTPException(status_code=404, detail="File not found")
 
-    if not file_path.is_file():
+    if not stat.S_ISREG(stat_result.st_mode):
         raise HTTPException(status_code=404, detail="Not a file")
 
-    if not file_path.is_relative_to(REPORTS_DIR.resolve()):
-        raise HTTPException(status_code=403, detail="File is outside reports directory")
+    location = _artifact_location(file_path)
+    if location is None:
+        raise HTTPException(status_code=403, detail="File is outside reports and charts directories")
+    kind, index_path = location
 
     ext = file_path.suffix.lower()
     if ext not in ALLOWED_REPORT_EXTENSIONS:
         raise HTTPException(status_code=400, detail=f"Unsupported file type: {ext}")
 
-    media_type = DOWNLOAD_MEDIA_TYPES.get(ext, "application/octet-stream")
-    if inline:
-        content = file_path.read_bytes()
-        return Response(
-            content=content,
-            media_type=media_type,
-            headers={"Content-Disposition": f'inline; filename="{file_path.name}"'},
-        )
+    sha256 = await artifacts.content_hash(index_path, kind, stat_result)
+    storage.touch(index_path)
+    etag = f'"{sha256}"'
+    headers = {
+        "ETag": etag,
+        "Last-Modified": formatdate(stat_result.st_mtime, usegmt=True),
+        "Cache-Control": IMMUTABLE_CACHE_CONTROL if v == sha256 else REVALIDATE_CACHE_CONTROL,
+    }
+    if _not_modified(request, etag, stat_result.st_mtime):
+        return Response(status_code=304, headers=headers)
+
+    # FileResponse streams in chunks and handles Range / If-Range (PDF viewers seek).
     return FileResponse(
         path=str(file_path),
-        media_type=media_type,
+        media_type=DOWNLOAD_MEDIA_TYPES.get(ext, "application/octet-stream"),
         filename=file_path.name,
+        stat_result=stat_result,
+        headers=headers,
+        content_disposition_type="inline" if inline else "attachment",
     )
 
 
+class UpdateReportRequest(BaseModel):
+    name: str | None = None
+    pinned: bool | None = None
+
+
 @app.patch("/api/reports/{filename}")
-async def rename_report(
+async def update_report(
     filename: str,
-    body: dict,
+    body: UpdateReportRequest,
     user: str = Depends(get_current_user),
 ):
-    new_name = body.get("name", "").strip()
-    if not new_name:
-        raise HTTPException(status_code=400, detail="New name is required")
+    """Rename a report and/or keep it (pinned reports are never evicted by the quota sweep)."""
+    new_name = (body.name or "").strip()
+    if not new_name and body.pinned is None:
+        raise HTTPException(status_code=400, detail="New name or pinned is required")
 
     # Validate old filename
     safe_old = Path(filename).name
     if not safe_old or safe_old != filename or ".." in filename or "/" in filename:
         raise HTTPException(status_code=400, detail=f"Invalid filename: {filename}")
 
+    if new_name:
+        await _rename_report(safe_old, new_name)
+        safe_old = new_name
+
+    result = {"ok": True, "name": safe_old}
+    if body.pinned is not None:
+        file_path = REPORTS_DIR / safe_old
+        if not await fileio.run(file_path.exists):
+            raise HTTPException(status_code=404, detail="File not found")
+        artifact = await artifacts.set_pinned(file_path, body.pinned)
+        if artifact is None:
+            artifact = await artifacts.record(file_path, "report", pinned=body.pinned)
+        result["pinned"] = bool(artifact.pinned)
+    return result
+
+
+async def _rename_report(safe_old: str, new_name: str):
     # Validate new filename
     safe_new = Path(new_name).name
     if not safe_new or safe_new != new_name or ".." in new_name or "/" in new_name:
@@ -709,8 +1262,10 @@ async def rename_report(
     if new_path.exists():
         raise HTTPException(status_code=409, detail=f"File already exists: {new_name}")
 
-    old_path.rename(new_path)
-    return {"ok": True, "name": safe_new}
+    await fileio.run(old_path.rename, new_path)
+    await fileio.run(previews.rename_thumbnail, old_path, new_path)
+    fileio.forget(old_path)
+    await artifacts.rename(REPORTS_DIR / safe_old, REPORTS_DIR / safe_new, "report")
 
 
 @app.delete("/api/reports/{filename}")
@@ -729,39 +1284,50 @@ async def delete_report(
     if not file_path.is_relative_to(REPORTS_DIR.resolve()):
         raise HTTPException(status_code=403, detail="File is outside reports directory")
 
-    file_path.unlink()
+    await fileio.run(file_path.unlink)
+    await fileio.run(previews.remove_thumbnail, file_path)
+    fileio.forget(file_path)
+    await artifacts.remove(REPORTS_DIR / safe_name)
     return {"ok": True}
 
 
+def _check_upload_name(filename: str):
+    safe_name = Path(filename).name
+    if not safe_name or safe_name != filename or ".." in filename or "/" in filename:
+        raise HTTPException(status_code=400, detail=f"Invalid filename: {filename}")
+    ext = Path(safe_name).suffix.lower()
+    if ext not in ALLOWED_UPLOAD_EXTENSIONS:
+        allowed = ", ".join(sorted(ALLOWED_UPLOAD_EXTENSIONS))
+        raise HTTPException(status_code=400, detail=f"Unsupported file type '{ext}'. Allowed: {allowed}")
+
+
 @app.post("/api/reports/upload")
 async def upload_report(
-    file: UploadFile = File(...),
+    request: Request,
     user: str = Depends(get_current_user),
 ):
-    if not file.filename:
-        raise HTTPException(status_code=400, detail="No filename provided")
+    # The body is parsed here, not through an UploadFile parameter, so the file
+    # is written and hashed once as it arrives and the size cap applies while reading.
+    max_body = MAX_UPLOAD_BYTES + _MULTIPART_OVERHEAD_BYTES
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > max_body:
+        raise HTTPException(status_code=413, detail=f"Upload exceeds {MAX_UPLOAD_BYTES} bytes")
 
-    safe_name = Path(file.filename).name
-    if not safe_name or safe_name != file.filename or ".." in file.filename or "/" in file.filename:
-        raise HTTPException(status_code=400, detail=f"Invalid filename: {file.filename}")
-
-    ext = Path(safe_name).suffix.lower()
-    if ext not in ALLOWED_UPLOAD_EXTENSIONS:
-        allowed = ", ".join(sorted(ALLOWED_UPLOAD_EXTENSIONS))
-        raise HTTPException(status_code=400, detail=f"Unsupported file type '{ext}'. Allowed: {allowed}")
+    try:
+        filename, tmp_path, _, sha256 = await uploads.receive_file(
+            request, REPORTS_DIR, MAX_UPLOAD_BYTES, max_body, _check_upload_name
+        )
+    except uploads.UploadTooLarge as exc:
+        raise HTTPException(status_code=413, detail=str(exc))
+    except uploads.UploadError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
 
-    file_path = REPORTS_DIR / safe_name
-    content = await file.read()
-    file_path.write_bytes(content)
+    file_path = REPORTS_DIR / filename
+    await fileio.run(os.replace, tmp_path, file_path)
 
-    stat = file_path.stat()
-    return {
-        "name": safe_name,
-        "path": str(file_path),
-        "type": ext.lstrip("."),
-        "sizeBytes": stat.st_size,
-        "modifiedAt": datetime.fromtimestamp(stat.st_mtime, tz=timezone.utc).isoformat(),
-    }
+    # An upload is the user's own file rather than agent output, so it is kept.
+    artifact = await artifacts.record(file_path, "report", sha256=sha256, pinned=True)
+    return artifacts.artifact_to_dict(artifact)
 
 
 # ─── Existing endpoints ─────────────────────────────────────────────────────
@@ -772,10 +1338,35 @@ async def hello():
     return {"message": "Hello, World!"}
 
 
+PREVIEW_MEDIA_TYPES = {
+    "html": "text/html; charset=utf-8",
+    "javascript": "text/javascript; charset=utf-8",
+    "jsx": "text/plain; charset=utf-8",
+    "tsx": "text/plain; charset=utf-8",
+    "png": "image/png",
+    "csv": "text/csv; charset=utf-8",
+}
+# Raw previews are served from the API origin; never let them run as a page there.
+PREVIEW_RAW_HEADERS = {
+    "Content-Security-Policy": "sandbox",
+    "X-Content-Type-Options": "nosniff",
+}
+
+
 @app.get("/api/fetch_file")
-async def fetch_file(path: str = Query(..., description="Absolute path to a previewable file")):
+async def fetch_file(
+    request: Request,
+    path: str = Query(..., description="Absolute path to a previewable file"),
+    raw: bool = Query(False, description="Return the file bytes with its media type instead of JSON"),
+    offset: int | None = Query(None, ge=0, description="Byte offset of a text page"),
+    limit: int | None = Query(None, ge=1, le=4 * 1024 * 1024, description="Page size in bytes"),
+):
     try:
-        return _load_viewable_file(path)
+        if raw:
+            return await _raw_preview(request, path)
+        if offset is not None or limit is not None:
+            return await _paged_preview(path, offset or 0, limit or previews.PREVIEW_PAGE_BYTES)
+        return await _load_viewable_file(path)
     except FileNotFoundError as exc:
         raise HTTPException(status_code=404, detail=str(exc)) from exc
     except PermissionError as exc:
@@ -784,6 +1375,141 @@ async def fetch_file(path: str = Query(..., description="Absolute path to a prev
         raise HTTPException(status_code=400, detail=str(exc)) from exc
 
 
+async def _raw_preview(request: Request, path_value: str) -> Response:
+    file_path, st = await _resolve_viewable_file(path_value)
+    etag = f'"{st.st_mtime_ns:x}-{st.st_size:x}"'
+    headers = {
+        **PREVIEW_RAW_HEADERS,
+        "ETag": etag,
+        "Last-Modified": formatdate(st.st_mtime, usegmt=True),
+        "Cache-Control": REVALIDATE_CACHE_CONTROL,
+    }
+    if _not_modified(request, etag, st.st_mtime):
+        return Response(status_code=304, headers=headers)
+
+    media_type = PREVIEW_MEDIA_TYPES[VIEWABLE_EXTENSIONS[file_path.suffix.lower()]]
+    if st.st_size > previews.PREVIEW_CACHE_MAX_ENTRY_BYTES:
+        return FileResponse(str(file_path), media_type=media_type, stat_result=st, headers=headers)
+    data = await previews.cache.read(file_path, st)
+    return Response(content=data, media_type=media_type, headers=headers)
+
+
+async def _paged_preview(path_value: str, offset: int, limit: int) -> dict:
+    file_path, st = await _resolve_viewable_file(path_value)
+    language = VIEWABLE_EXTENSIONS[file_path.suffix.lower()]
+    result = {"path": str(file_path), "language": language, "sizeBytes": st.st_size, "offset": offset}
+
+    if language == "png":
+        # Pages are text; base64 in JSON would cost a third more bytes plus a decode.
+        raise ValueError("Images aren't paged; request them with raw=true.")
+
+    if offset > st.st_size:
+        raise ValueError(f"Offset {offset} is past the end of the file ({st.st_size} bytes).")
+    content, next_offset = await previews.read_page(file_path, st, offset, limit, by_line=language == "csv")
+    result.update(content=content, nextOffset=next_offset)
+    return result
+
+
+@app.get("/api/reports/thumbnail")
+async def report_thumbnail(
+    path: str = Query(..., description="Absolute path to a PNG report or chart"),
+    user: str = Depends(get_current_user),
+):
+    try:
+        file_path = await fileio.resolve(path)
+        st = await fileio.stat(file_path)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="File not found")
+
+    location = _artifact_location(file_path)
+    if location is None:
+        raise HTTPException(status_code=403, detail="File is outside reports and charts directories")
+    if file_path.suffix.lower() != ".png":
+        raise HTTPException(status_code=400, detail="Thumbnails are only available for PNG files")
+
+    storage.touch(location[1])
+    thumbnail = await previews.get_thumbnail(file_path, st)
+    if thumbnail is None:
+        raise HTTPException(status_code=500, detail="Failed to create thumbnail")
+    return FileResponse(str(thumbnail), media_type="image/png", headers={"Cache-Control": REVALIDATE_CACHE_CONTROL})
+
+
+@app.get("/api/analytics/resolution-times")
+async def resolution_times_endpoint(
+    type: str | None = Query(None, description="sr_type_desc"),
+    department: str | None = Query(None, description="sr_department_desc"),
+    district: str | None = Query(None, description="Council district"),
+    month: str | None = Query(None, pattern=r"^\d{4}-\d{2}$", description="Created month (YYYY-MM)"),
+    user: str = Depends(get_current_user),
+):
+    state = await _load_ingest_state(RESOLUTION_PATH, resolution.load)
+    if state is None:
+        raise HTTPException(status_code=503, detail="Resolution statistics have not been built yet")
+    return state.summary(type, department, district, month)
+
+
+@app.get("/api/analytics/anomalies")
+async def anomalies_endpoint(
+    days: int = Query(7, ge=1, le=anomalies.ANOMALY_RETENTION_DAYS),
+    dimension: str | None = Query(None, pattern="^(type|district|all)$"),
+    value: str | None = Query(None, description="Request type or district"),
+    user: str = Depends(get_current_user),
+):
+    state = await _load_ingest_state(ANOMALIES_PATH, anomalies.load)
+    if state is None:
+        raise HTTPException(status_code=503, detail="Anomaly baselines have not been built yet")
+    return state.query(days, dimension, value)
+
+
+async def _stream_export(chunks):
+    # Encoding runs on the file I/O pool, one chunk at a time.
+    while (chunk := await fileio.run(next, chunks, None)) is not None:
+        yield chunk
+
+
+@app.get("/api/data/export")
+async def export_dataset(
+    request: Request,
+    token: str | None = Query(None, description="Link token from export_data; replaces the other parameters and the Authorization header"),
+    user: str | None = Depends(get_optional_user),
+):
+    """Stream filtered rows (format, columns, type, department, status, district, since, until, open, gzip)."""
+    if token:
+        params = verify_link_token(token, "export")
+    elif user is None:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    else:
+        params = dict(request.query_params)
+        for flag in ("open", "gzip"):
+            params[flag] = params.get(flag, "").lower() in ("1", "true", "yes")
+
+    export = await _build_export(params)
+    return StreamingResponse(
+        _stream_export(export.chunks()),
+        media_type=export.media_type,
+        headers={"Content-Disposition": f'attachment; filename="{export.filename()}"'},
+    )
+
+
+@app.get("/api/metrics")
+async def metrics(
+    user: str = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    current = await fileio.run(snapshot.current)
+    return {
+        "worker": leader.stats(),
+        "snapshot": current.stats() if current else None,
+        "persistence": persistence.stats(),
+        "messageStorage": await storage_stats(db),
+        "fileio": fileio.stats(),
+        "previewCache": previews.cache.stats(),
+        "storage": storage.stats(),
+        "socrata": socrata.stats(),
+        "eventLoop": loop_lag.stats(),
+    }
+
+
 @app.post("/api/chat")
 async def chat(
     request: Request,
@@ -794,6 +1520,7 @@ async def chat(
     session_id = body.get("session_id")
     user_msg_id = body.get("user_msg_id")
     assistant_msg_id = body.get("assistant_msg_id")
+    _request_base_url.set(str(request.base_url).rstrip("/"))
 
     logger.info(f"=== /api/chat received {len(messages)} messages, session_id={session_id} ===")
     for i, msg in enumerate(messages):
@@ -801,36 +1528,20 @@ async def chat(
         text = _extract_text(msg)
         logger.info(f"  msg[{i}] role={role} text={text[:200]}")
 
-    # Persist user message and auto-create session if needed
+    # Queue the user message and auto-create the session if needed
     if session_id:
         try:
-            async with get_async_session()() as db:
-                # Auto-create session if it doesn't exist
-                result = await db.execute(select(Session).where(Session.id == session_id))
-                sess = result.scalar_one_or_none()
-                if not sess:
-                    sess = Session(id=session_id, title="New Chat")
-                    db.add(sess)
-
-                # Save user message
-                if user_msg_id and messages:
-                    last_user = None
-                    for msg in reversed(messages):
-                        if msg.get("role") == "user":
-                            last_user = msg
-                            break
-                    if last_user:
-                        db_msg = Message(
-                            id=user_msg_id,
-                            session_id=session_id,
-                            role="user",
-                            content=_extract_text(last_user),
-                        )
-                        db.add(db_msg)
-
-                await db.commit()
+            persistence.ensure_session(session_id)
+            if user_msg_id and messages:
+                last_user = None
+                for msg in reversed(messages):
+                    if msg.get("role") == "user":
+                        last_user = msg
+                        break
+                if last_user:
+                    persistence.add_message(user_msg_id, session_id, "user", _extract_text(last_user))
         except Exception:
-            logger.exception("Failed to save user message to DB")
+            logger.exception("Failed to queue user message for DB")
 
     return StreamingResponse(
         _stream_chat(messages, session_id, user_msg_id, assistant_msg_id),
@@ -0,0 +1,191 @@
+"""Compressed, offloaded storage for large message content.
+
+Messages above MESSAGE_OFFLOAD_BYTES keep only a short excerpt in
+`messages.content` (what lists and previews see) and store the full text
+compressed in `message_bodies`, loaded only when a caller asks for it. Search
+indexes the full text: whoever offloads a message calls `search.index_full_text`.
+
+Run `python -m agent311.message_store` to offload messages written before this
+existed.
+"""
+
+import asyncio
+import gzip
+import os
+from datetime import datetime
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from agent311.db import Message, MessageBody, get_async_session
+from agent311.search import index_full_text
+
+try:
+    import zstandard
+except ImportError:  # optional; gzip is always available
+    zstandard = None
+
+MESSAGE_OFFLOAD_BYTES = int(os.environ.get("MESSAGE_OFFLOAD_BYTES", "32768"))
+MESSAGE_EXCERPT_CHARS = int(os.environ.get("MESSAGE_EXCERPT_CHARS", "2000"))
+CODEC = "zstd" if zstandard is not None else "gzip"
+
+
+def _compress(raw: bytes) -> bytes:
+    if CODEC == "zstd":
+        return zstandard.ZstdCompressor(level=10).compress(raw)
+    return gzip.compress(raw, compresslevel=6)
+
+
+def _decompress(codec: str, data: bytes) -> str:
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("Message body is zstd-compressed but zstandard is not installed")
+        raw = zstandard.ZstdDecompressor().decompress(data)
+    elif codec == "gzip":
+        raw = gzip.decompress(data)
+    else:
+        raise ValueError(f"Unknown message body codec: {codec}")
+    return raw.decode("utf-8")
+
+
+def _pack(content: str) -> tuple[str, int, MessageBody | None]:
+    """Return (stored content, full size in bytes, body or None if stored inline)."""
+    raw = content.encode("utf-8")
+    if len(raw) <= MESSAGE_OFFLOAD_BYTES:
+        return content, len(raw), None
+    body = MessageBody(codec=CODEC, data=_compress(raw), raw_size=len(raw))
+    return content[:MESSAGE_EXCERPT_CHARS], len(raw), body
+
+
+async def _pack_async(content: str) -> tuple[str, int, MessageBody | None]:
+    # Compressing a few hundred KB takes milliseconds; keep it off the event loop.
+    if len(content) > MESSAGE_OFFLOAD_BYTES // 4:
+        return await asyncio.to_thread(_pack, content)
+    return _pack(content)
+
+
+async def build_message(
+    id: str, session_id: str, role: str, content: str, created_at: datetime | None = None
+) -> Message:
+    stored, size, body = await _pack_async(content)
+    message = Message(
+        id=id,
+        session_id=session_id,
+        role=role,
+        content=stored,
+        content_size=size,
+        is_offloaded=body is not None,
+    )
+    if created_at is not None:
+        message.created_at = created_at
+    if body is not None:
+        message.body = body
+    return message
+
+
+async def set_content(db: AsyncSession, message: Message, content: str):
+    """Replace a message's content, moving it in or out of message_bodies as needed."""
+    stored, size, body = await _pack_async(content)
+    existing = await db.get(MessageBody, message.id) if message.is_offloaded else None
+    if body is None:
+        if existing is not None:
+            await db.delete(existing)
+    elif existing is not None:
+        existing.codec, existing.data, existing.raw_size = body.codec, body.data, body.raw_size
+    else:
+        body.message_id = message.id
+        db.add(body)
+    message.content = stored
+    message.content_size = size
+    message.is_offloaded = body is not None
+    if body is not None:
+        await db.flush()
+        await index_full_text(db, message.id, content)
+
+
+async def load_full_contents(db: AsyncSession, messages: list[Message]) -> dict[str, str]:
+    """Full text for each message, fetching offloaded bodies in one query."""
+    contents = {m.id: m.content for m in messages}
+    offloaded = [m.id for m in messages if m.is_offloaded]
+    if offloaded:
+        result = await db.execute(select(MessageBody).where(MessageBody.message_id.in_(offloaded)))
+        bodies = result.scalars().all()
+        decoded = await asyncio.to_thread(
+            lambda: {b.message_id: _decompress(b.codec, b.data) for b in bodies}
+        )
+        contents.update(decoded)
+    return contents
+
+
+async def storage_stats(db: AsyncSession) -> dict:
+    result = await db.execute(
+        select(
+            func.count(),
+            func.coalesce(func.sum(MessageBody.raw_size), 0),
+            func.coalesce(func.sum(func.length(MessageBody.data)), 0),
+        )
+    )
+    count, raw_bytes, stored_bytes = result.one()
+    return {
+        "codec": CODEC,
+        "offloadThresholdBytes": MESSAGE_OFFLOAD_BYTES,
+        "offloadedMessages": count,
+        "rawBytes": raw_bytes,
+        "storedBytes": stored_bytes,
+        "savedBytes": raw_bytes - stored_bytes,
+    }
+
+
+async def offload_existing(batch_size: int = 200) -> int:
+    """Offload inline messages larger than the threshold. Returns how many moved."""
+    moved = 0
+    last_id = ""
+    while True:
+        async with get_async_session()() as db:
+            # A message over N bytes has at least N/4 characters, so this pre-filter is safe.
+            result = await db.execute(
+                select(Message)
+                .where(Message.is_offloaded == False)  # noqa: E712
+                .where(func.length(Message.content) > MESSAGE_OFFLOAD_BYTES // 4)
+                .where(Message.id > last_id)
+                .order_by(Message.id)
+                .limit(batch_size)
+            )
+            batch = result.scalars().all()
+            if not batch:
+                return moved
+            last_id = batch[-1].id
+            for message in batch:
+                if len(message.content.encode("utf-8")) > MESSAGE_OFFLOAD_BYTES:
+                    await set_content(db, message, message.content)
+                    moved += 1
+            await db.commit()
+
+
+async def reindex_offloaded(batch_size: int = 200) -> int:
+    """Index the full text of every offloaded message, after the search index is (re)built."""
+    indexed = 0
+    last_id = ""
+    while True:
+        async with get_async_session()() as db:
+            result = await db.execute(
+                select(MessageBody)
+                .where(MessageBody.message_id > last_id)
+                .order_by(MessageBody.message_id)
+                .limit(batch_size)
+            )
+            bodies = result.scalars().all()
+            if not bodies:
+                return indexed
+            last_id = bodies[-1].message_id
+            decoded = await asyncio.to_thread(
+                lambda: {b.message_id: _decompress(b.codec, b.data) for b in bodies}
+            )
+            for message_id, content in decoded.items():
+                await index_full_text(db, message_id, content)
+            indexed += len(decoded)
+            await db.commit()
+
+
+if __name__ == "__main__":
+    print(f"Offloaded {asyncio.run(offload_existing())} messages")
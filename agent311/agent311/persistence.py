@@ -0,0 +1,181 @@
+"""Write-behind persistence for chat sessions and messages.
+
+Request handlers enqueue writes and return immediately. A background task owned
+by the app lifespan drains the queue and commits writes in grouped transactions,
+waiting at most PERSIST_MAX_DELAY_MS for a batch to fill.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timezone
+
+from sqlalchemy import select, update
+
+from agent311.db import Session, get_async_session
+from agent311.message_store import build_message
+from agent311.search import index_full_text
+
+logger = logging.getLogger(__name__)
+
+PERSIST_BATCH_SIZE = int(os.environ.get("PERSIST_BATCH_SIZE", "100"))
+PERSIST_MAX_DELAY_MS = int(os.environ.get("PERSIST_MAX_DELAY_MS", "50"))
+
+
+class PersistenceWriter:
+    """Batches session upserts, message inserts and session timestamp bumps."""
+
+    def __init__(self, batch_size: int = PERSIST_BATCH_SIZE, max_delay_ms: int = PERSIST_MAX_DELAY_MS):
+        self.batch_size = batch_size
+        self.max_delay = max_delay_ms / 1000
+        self._queue: asyncio.Queue[tuple | None] = asyncio.Queue()
+        self._task: asyncio.Task | None = None
+        self._closed = False
+        self._batches = 0
+        self._items = 0
+        self._failures = 0
+        self._last_batch_size = 0
+        self._max_batch_size = 0
+        self._last_lag_ms = 0.0
+        self._max_lag_ms = 0.0
+
+    def start(self):
+        if self._task is None:
+            # A fresh queue binds to the running loop (the app may be started more than once).
+            self._queue = asyncio.Queue()
+            self._closed = False
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        """Flush every pending write, then stop the background task."""
+        if self._task is None:
+            return
+        self._closed = True
+        await self._queue.put(None)
+        await self._task
+        self._task = None
+
+    def ensure_session(self, session_id: str, title: str = "New Chat"):
+        """Create the session if it doesn't exist yet."""
+        self._put(("session", session_id, title))
+
+    def add_message(self, message_id: str, session_id: str, role: str, content: str):
+        # created_at is taken now so ordering reflects the turn, not the commit.
+        self._put(("message", {
+            "id": message_id,
+            "session_id": session_id,
+            "role": role,
+            "content": content,
+            "created_at": datetime.now(timezone.utc),
+        }))
+
+    def touch_session(self, session_id: str):
+        self._put(("touch", session_id, datetime.now(timezone.utc)))
+
+    async def flush(self):
+        """Wait until every write queued before this call has been committed."""
+        if self._task is None:
+            return
+        done = asyncio.get_running_loop().create_future()
+        self._put(("flush", done))
+        await done
+
+    def stats(self) -> dict:
+        return {
+            "pending": self._queue.qsize(),
+            "batches": self._batches,
+            "items": self._items,
+            "failures": self._failures,
+            "lastBatchSize": self._last_batch_size,
+            "maxBatchSize": self._max_batch_size,
+            "avgBatchSize": round(self._items / self._batches, 2) if self._batches else 0,
+            "lastLagMs": round(self._last_lag_ms, 1),
+            "maxLagMs": round(self._max_lag_ms, 1),
+        }
+
+    def _put(self, op: tuple):
+        if self._closed:
+            raise RuntimeError("PersistenceWriter is closed")
+        self._queue.put_nowait((time.monotonic(), op))
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = loop.time() + self.max_delay
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            await self._write_batch(batch)
+
+    async def _write_batch(self, batch: list[tuple]):
+        waiters = [op[1] for _, op in batch if op[0] == "flush"]
+        batch = [item for item in batch if item[1][0] != "flush"]
+        if not batch:
+            for done in waiters:
+                done.set_result(None)
+            return
+        try:
+            await self._commit([op for _, op in batch])
+        except Exception:
+            logger.exception(f"Failed to persist batch of {len(batch)}; retrying writes individually")
+            for _, op in batch:
+                try:
+                    await self._commit([op])
+                except Exception:
+                    self._failures += 1
+                    logger.exception(f"Dropping write that failed to persist: {op[0]}")
+        for done in waiters:
+            if not done.done():
+                done.set_result(None)
+
+        lag_ms = (time.monotonic() - batch[0][0]) * 1000
+        self._batches += 1
+        self._items += len(batch)
+        self._last_batch_size = len(batch)
+        self._max_batch_size = max(self._max_batch_size, len(batch))
+        self._last_lag_ms = lag_ms
+        self._max_lag_ms = max(self._max_lag_ms, lag_ms)
+
+    async def _commit(self, ops: list[tuple]):
+        sessions: dict[str, str] = {}
+        messages: list[dict] = []
+        touches: dict[str, datetime] = {}
+        for op in ops:
+            if op[0] == "session":
+                sessions.setdefault(op[1], op[2])
+            elif op[0] == "message":
+                messages.append(op[1])
+            elif op[0] == "touch":
+                touches[op[1]] = max(op[2], touches.get(op[1], op[2]))
+
+        async with get_async_session()() as db:
+            if sessions:
+                result = await db.execute(select(Session.id).where(Session.id.in_(sessions)))
+                existing = set(result.scalars().all())
+                db.add_all(
+                    Session(id=sid, title=title) for sid, title in sessions.items() if sid not in existing
+                )
+            built = [await build_message(**fields) for fields in messages]
+            db.add_all(built)
+            await db.flush()
+            for message, fields in zip(built, messages):
+                if message.is_offloaded:
+                    await index_full_text(db, message.id, fields["content"])
+            for sid, at in touches.items():
+                await db.execute(update(Session).where(Session.id == sid).values(updated_at=at))
+            await db.commit()
@@ -0,0 +1,150 @@
+"""Artifact previews: a bounded content cache, paged text reads and PNG thumbnails.
+
+Cached file bytes are keyed by (path, mtime, size), so an edited or replaced
+file is a cache miss, never stale. Thumbnails live next to the image in a
+`.thumbnails` directory and are generated when a PNG is saved (or lazily on
+first request for files that predate this).
+"""
+
+import io
+import logging
+import os
+from collections import OrderedDict
+from pathlib import Path
+
+from PIL import Image
+
+from agent311 import fileio
+
+logger = logging.getLogger(__name__)
+
+PREVIEW_CACHE_BYTES = int(os.environ.get("PREVIEW_CACHE_BYTES", str(64 * 1024 * 1024)))
+# Larger files are read straight from disk rather than evicting the whole cache.
+PREVIEW_CACHE_MAX_ENTRY_BYTES = int(os.environ.get("PREVIEW_CACHE_MAX_ENTRY_BYTES", str(8 * 1024 * 1024)))
+PREVIEW_PAGE_BYTES = int(os.environ.get("PREVIEW_PAGE_BYTES", str(256 * 1024)))
+THUMBNAIL_SIZE = int(os.environ.get("THUMBNAIL_SIZE", "320"))
+THUMBNAIL_DIR = ".thumbnails"
+
+
+class PreviewCache:
+    """LRU of file contents bounded by total bytes."""
+
+    def __init__(self, max_bytes: int = PREVIEW_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[tuple[str, int, int], bytes] = OrderedDict()
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+
+    async def read(self, path: Path, st: os.stat_result) -> bytes:
+        key = (str(path), st.st_mtime_ns, st.st_size)
+        data = self._entries.get(key)
+        if data is not None:
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return data
+
+        self._misses += 1
+        data = await fileio.read_bytes(path)
+        if len(data) <= PREVIEW_CACHE_MAX_ENTRY_BYTES:
+            self._put(key, data)
+        return data
+
+    def _put(self, key: tuple[str, int, int], data: bytes):
+        # Older versions of the same file can never be hit again.
+        for stale in [k for k in self._entries if k[0] == key[0]]:
+            self._bytes -= len(self._entries.pop(stale))
+        self._entries[key] = data
+        self._bytes += len(data)
+        while self._bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= len(evicted)
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "maxBytes": self.max_bytes,
+            "hits": self._hits,
+            "misses": self._misses,
+        }
+
+
+cache = PreviewCache()
+
+
+def _read_range(path: Path, offset: int, length: int) -> bytes:
+    with open(path, "rb") as f:
+        f.seek(offset)
+        return f.read(length)
+
+
+async def read_page(path: Path, st: os.stat_result, offset: int, limit: int, by_line: bool = False) -> tuple[str, int | None]:
+    """Decode up to `limit` bytes of text starting at `offset`.
+
+    The page never ends inside a UTF-8 sequence, and with `by_line` (CSV) it ends
+    after the last complete line when there is one. Returns (text, next offset or
+    None at end of file).
+    """
+    # A few extra bytes tell us whether the cut lands inside a character.
+    want = limit + 4
+    if st.st_size <= PREVIEW_CACHE_MAX_ENTRY_BYTES:
+        raw = (await cache.read(path, st))[offset:offset + want]
+    else:
+        raw = await fileio.run(_read_range, path, offset, want)
+
+    end = min(limit, len(raw))
+    if end < len(raw):
+        while end > 0 and (raw[end] & 0xC0) == 0x80:
+            end -= 1
+        if by_line:
+            newline = raw.rfind(b"\n", 0, end)
+            if newline >= 0:
+                end = newline + 1
+    next_offset = offset + end if offset + end < st.st_size else None
+    return raw[:end].decode("utf-8", errors="replace"), next_offset
+
+
+def thumbnail_path(path: Path) -> Path:
+    return path.parent / THUMBNAIL_DIR / path.name
+
+
+def _render_thumbnail(path: Path) -> bytes:
+    with Image.open(path) as image:
+        image.thumbnail((THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+        buf = io.BytesIO()
+        image.save(buf, format="PNG", optimize=True)
+    thumbnail_path(path).parent.mkdir(exist_ok=True)
+    return buf.getvalue()
+
+
+async def create_thumbnail(path: Path) -> Path | None:
+    """Generate the thumbnail for a PNG. Failures are logged, not raised."""
+    target = thumbnail_path(path)
+    try:
+        await fileio.write_atomic(target, await fileio.run(_render_thumbnail, path))
+    except Exception:
+        logger.exception(f"Failed to create thumbnail for {path}")
+        return None
+    return target
+
+
+async def get_thumbnail(path: Path, st: os.stat_result) -> Path | None:
+    """Thumbnail for path, regenerating it if missing or older than the image."""
+    target = thumbnail_path(path)
+    try:
+        if (await fileio.stat(target)).st_mtime_ns >= st.st_mtime_ns:
+            return target
+    except FileNotFoundError:
+        pass
+    return await create_thumbnail(path)
+
+
+def remove_thumbnail(path: Path):
+    thumbnail_path(path).unlink(missing_ok=True)
+
+
+def rename_thumbnail(old_path: Path, new_path: Path):
+    old = thumbnail_path(old_path)
+    if old.exists():
+        os.replace(old, thumbnail_path(new_path))
@@ -0,0 +1,266 @@
+"""Resolution-time quantile sketches maintained at ingest.
+
+`download_311` calls `update` with the rows that changed in each delta. Closed
+requests add `sr_closed_date - sr_created_date` (hours) to a mergeable
+log-bucket sketch (DDSketch-style, RESOLUTION_SKETCH_ALPHA relative error) for
+every rollup of their (type, department, district, created month) key. The
+rollups are all 16 combinations with "*" standing for "any", so a lookup is a
+single dict access. A closed row is counted if it is new to this snapshot (its
+sr_number wasn't in the previous one) or was still open last time. Still-open
+requests are kept in an open set for that, so each closure is counted exactly
+once, and backlog counts are rebuilt from it. Deciding by membership rather than
+by closed date matters because Socrata publishes rows late: a row new in this
+run can have closed before rows counted in the previous one.
+
+State lives in a gzipped JSON file next to the CSV.
+"""
+
+import gzip
+import json
+import math
+import os
+from datetime import datetime, timezone
+from itertools import product
+from pathlib import Path
+
+import pandas as pd
+
+STATE_FILENAME = "311_resolution.json.gz"
+STATE_VERSION = 1
+RESOLUTION_SKETCH_ALPHA = float(os.environ.get("RESOLUTION_SKETCH_ALPHA", "0.02"))
+# Durations under a minute (or negative, from bad data) go in the zero bucket.
+MIN_HOURS = 1 / 60
+ANY = "*"
+KEY_SEPARATOR = "\t"
+
+
+class LogSketch:
+    """Quantile sketch with relative-error guarantees; merge is bucket-wise addition."""
+
+    def __init__(self, alpha: float = RESOLUTION_SKETCH_ALPHA):
+        self.gamma = (1 + alpha) / (1 - alpha)
+        self._log_gamma = math.log(self.gamma)
+        self.buckets: dict[int, int] = {}
+        self.zero = 0
+        self.count = 0
+        self.total = 0.0
+
+    def bucket(self, value: float) -> int | None:
+        return None if value < MIN_HOURS else math.ceil(math.log(value) / self._log_gamma)
+
+    def add_bucket(self, index: int | None, count: int, total: float):
+        if index is None:
+            self.zero += count
+        else:
+            self.buckets[index] = self.buckets.get(index, 0) + count
+        self.count += count
+        self.total += total
+
+    def merge(self, other: "LogSketch"):
+        for index, count in other.buckets.items():
+            self.buckets[index] = self.buckets.get(index, 0) + count
+        self.zero += other.zero
+        self.count += other.count
+        self.total += other.total
+
+    def quantile(self, q: float) -> float | None:
+        if self.count == 0:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zero
+        if seen > rank:
+            return 0.0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen > rank:
+                return 2 * self.gamma ** index / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.buckets) / (self.gamma + 1)
+
+    def to_json(self) -> dict:
+        return {"b": {str(i): c for i, c in self.buckets.items()}, "z": self.zero, "n": self.count, "s": round(self.total, 3)}
+
+    @classmethod
+    def from_json(cls, data: dict, alpha: float) -> "LogSketch":
+        sketch = cls(alpha)
+        sketch.buckets = {int(i): c for i, c in data["b"].items()}
+        sketch.zero, sketch.count, sketch.total = data["z"], data["n"], data["s"]
+        return sketch
+
+
+def _join(parts) -> str:
+    return KEY_SEPARATOR.join(parts)
+
+
+def _rollups(parts: tuple[str, ...]) -> list[str]:
+    """Every key the parts contribute to: each position either itself or ANY."""
+    return [_join(choice) for choice in product(*((p, ANY) for p in parts))]
+
+
+def _key_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """Normalized key columns (type, department, district, month) for each row."""
+    district = df["sr_location_council_district"]
+    if pd.api.types.is_float_dtype(district):
+        district = district.astype("Int64")
+    return pd.DataFrame({
+        "type": df["sr_type_desc"].fillna("unknown").astype(str),
+        "department": df["sr_department_desc"].fillna("unknown").astype(str),
+        "district": district.astype("string").fillna("unknown").astype(str),
+        "month": df["sr_created_date"].astype(str).str[:7],
+    }, index=df.index)
+
+
+class ResolutionState:
+    def __init__(self, alpha: float = RESOLUTION_SKETCH_ALPHA):
+        self.alpha = alpha
+        self.sketches: dict[str, LogSketch] = {}
+        # sr_number -> [type, department, district, month] for requests not yet closed
+        self.open: dict[str, list[str]] = {}
+        self.open_counts: dict[str, int] = {}
+        self.updated_at: str | None = None
+        self._lookup: dict[str, str] | None = None
+
+    def apply(self, df: pd.DataFrame, previous: pd.Series | None = None):
+        """Fold in changed rows. Closed rows are counted once; open rows join the backlog.
+
+        previous holds the sr_numbers of the snapshot the rows were diffed
+        against; None means none of the rows have been seen before.
+        """
+        if df.empty or "sr_number" not in df:
+            return
+        df = df.drop_duplicates(subset="sr_number", keep="first")
+        keys = _key_frame(df)
+        numbers = df["sr_number"].astype(str)
+        closed_at = df["sr_closed_date"]
+        is_closed = closed_at.notna()
+
+        # Rows of the previous snapshot were counted then, unless they were still open.
+        if previous is None:
+            is_new = pd.Series(True, index=df.index)
+        else:
+            is_new = ~numbers.isin(previous.astype(str)) | numbers.isin(self.open.keys())
+        counted = df[is_closed & is_new]
+        if not counted.empty:
+            created = pd.to_datetime(counted["sr_created_date"], errors="coerce", utc=True)
+            closed = pd.to_datetime(counted["sr_closed_date"], errors="coerce", utc=True)
+            hours = ((closed - created).dt.total_seconds() / 3600).clip(lower=0)
+            valid = hours.notna()
+            self._add(keys.loc[counted.index[valid]], hours[valid])
+
+        for number in numbers[is_closed]:
+            self.open.pop(number, None)
+        open_rows = keys[~is_closed]
+        for number, row in zip(numbers[~is_closed], open_rows.itertuples(index=False)):
+            self.open[number] = list(row)
+        self._rebuild_open_counts()
+        self.updated_at = datetime.now(timezone.utc).isoformat(timespec="seconds")
+        self._lookup = None
+
+    def _add(self, keys: pd.DataFrame, hours: pd.Series):
+        probe = LogSketch(self.alpha)
+        frame = keys.assign(
+            bucket=[probe.bucket(h) for h in hours],
+            hours=hours.values,
+        )
+        frame["bucket"] = frame["bucket"].astype("Int64")
+        grouped = frame.groupby(["type", "department", "district", "month", "bucket"], dropna=False)["hours"].agg(["size", "sum"])
+        for (t, dept, district, month, bucket), (count, total) in grouped.iterrows():
+            index = None if pd.isna(bucket) else int(bucket)
+            for key in _rollups((t, dept, district, month)):
+                sketch = self.sketches.get(key)
+                if sketch is None:
+                    sketch = self.sketches[key] = LogSketch(self.alpha)
+                sketch.add_bucket(index, int(count), float(total))
+
+    def _rebuild_open_counts(self):
+        counts: dict[str, int] = {}
+        for parts in self.open.values():
+            for key in _rollups(tuple(parts)):
+                counts[key] = counts.get(key, 0) + 1
+        self.open_counts = counts
+
+    def _resolve_key(self, type: str | None, department: str | None, district: str | None, month: str | None) -> str:
+        key = _join(v.strip() if v else ANY for v in (type, department, district, month))
+        if key in self.sketches or key in self.open_counts:
+            return key
+        if self._lookup is None:
+            self._lookup = {k.lower(): k for k in (*self.sketches, *self.open_counts)}
+        return self._lookup.get(key.lower(), key)
+
+    def summary(self, type: str | None = None, department: str | None = None,
+                district: str | None = None, month: str | None = None) -> dict:
+        """p50/p90/p99 resolution hours and open backlog for one key ("*" or None = any)."""
+        key = self._resolve_key(type, department, district, month)
+        sketch = self.sketches.get(key) or LogSketch(self.alpha)
+        t, dept, dist, mon = key.split(KEY_SEPARATOR)
+
+        def hours(value):
+            return None if value is None else round(value, 2)
+
+        return {
+            "type": t,
+            "department": dept,
+            "district": dist,
+            "month": mon,
+            "closedCount": sketch.count,
+            "openCount": self.open_counts.get(key, 0),
+            "meanHours": hours(sketch.total / sketch.count) if sketch.count else None,
+            "p50Hours": hours(sketch.quantile(0.5)),
+            "p90Hours": hours(sketch.quantile(0.9)),
+            "p99Hours": hours(sketch.quantile(0.99)),
+            "relativeError": self.alpha,
+            "updatedAt": self.updated_at,
+        }
+
+    def to_json(self) -> dict:
+        return {
+            "version": STATE_VERSION,
+            "alpha": self.alpha,
+            "updatedAt": self.updated_at,
+            "sketches": {k: s.to_json() for k, s in self.sketches.items()},
+            "open": self.open,
+        }
+
+    @classmethod
+    def from_json(cls, data: dict) -> "ResolutionState":
+        state = cls(data["alpha"])
+        state.updated_at = data.get("updatedAt")
+        state.sketches = {k: LogSketch.from_json(s, state.alpha) for k, s in data["sketches"].items()}
+        state.open = data["open"]
+        state._rebuild_open_counts()
+        return state
+
+
+def load(path: Path) -> ResolutionState | None:
+    try:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return None
+    if data.get("version") != STATE_VERSION:
+        return None
+    return ResolutionState.from_json(data)
+
+
+def save(state: ResolutionState, path: Path):
+    tmp = path.with_name(path.name + ".tmp")
+    with gzip.open(tmp, "wt", encoding="utf-8", compresslevel=6) as f:
+        json.dump(state.to_json(), f, separators=(",", ":"))
+    os.replace(tmp, path)
+
+
+def update(data_dir: Path, changed: pd.DataFrame, full: pd.DataFrame,
+           previous: pd.Series | None = None) -> ResolutionState:
+    """Apply an ingest's changed rows, given the sr_numbers of the previous snapshot.
+
+    Builds from the full snapshot when there is no state yet, or when there is no
+    previous snapshot to tell new rows from already counted ones.
+    """
+    path = data_dir / STATE_FILENAME
+    state = load(path)
+    if state is None or previous is None:
+        state = ResolutionState()
+        state.apply(full)
+    else:
+        state.apply(changed, previous)
+    save(state, path)
+    return state
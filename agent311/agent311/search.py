@@ -0,0 +1,172 @@
+"""Full-text search over chat messages.
+
+Postgres indexes a `search_vector` tsvector column with GIN; SQLite mirrors
+message content into an FTS5 table. Database triggers keep both in sync with
+`messages.content`, so every insert path and update_message stay indexed.
+
+Offloaded messages keep only an excerpt in `content`, so after writing one the
+application calls `index_full_text` to replace the trigger's entry with the
+full text. `create_search_index` reports when the index was created or
+upgraded, so existing offloaded messages can be reindexed once.
+"""
+
+import re
+
+from sqlalchemy import DateTime, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+# Cap on the text fed to to_tsvector; a tsvector is limited to 1 MB.
+PG_INDEXED_CHARS = 100_000
+SNIPPET_START = "**"
+SNIPPET_STOP = "**"
+
+# Bumped when existing rows need reindexing (2: full text of offloaded messages).
+SEARCH_INDEX_VERSION = 2
+
+_PG_DDL = [
+    # Version 1 generated the column from content; it is now written by a trigger and the app.
+    """DO $$ BEGIN
+        IF EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name = 'messages'
+                   AND column_name = 'search_vector' AND is_generated = 'ALWAYS') THEN
+            ALTER TABLE messages ALTER COLUMN search_vector DROP EXPRESSION;
+        END IF;
+    END $$""",
+    "ALTER TABLE messages ADD COLUMN IF NOT EXISTS search_vector tsvector",
+    f"""CREATE OR REPLACE FUNCTION messages_search_vector_update() RETURNS trigger AS $$ BEGIN
+        NEW.search_vector := to_tsvector('english'::regconfig, left(NEW.content, {PG_INDEXED_CHARS}));
+        RETURN NEW;
+    END $$ LANGUAGE plpgsql""",
+    "DROP TRIGGER IF EXISTS messages_search_vector_trg ON messages",
+    """CREATE TRIGGER messages_search_vector_trg BEFORE INSERT OR UPDATE OF content ON messages
+        FOR EACH ROW EXECUTE FUNCTION messages_search_vector_update()""",
+    f"""UPDATE messages SET search_vector = to_tsvector('english'::regconfig, left(content, {PG_INDEXED_CHARS}))
+        WHERE search_vector IS NULL""",
+    "CREATE INDEX IF NOT EXISTS ix_messages_search_vector ON messages USING GIN (search_vector)",
+]
+
+_SQLITE_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+        content, message_id UNINDEXED, tokenize='porter unicode61')""",
+    """CREATE TRIGGER IF NOT EXISTS messages_fts_ai AFTER INSERT ON messages BEGIN
+        INSERT INTO messages_fts(rowid, content, message_id) VALUES (new.rowid, new.content, new.id);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS messages_fts_ad AFTER DELETE ON messages BEGIN
+        DELETE FROM messages_fts WHERE rowid = old.rowid;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS messages_fts_au AFTER UPDATE OF content ON messages BEGIN
+        UPDATE messages_fts SET content = new.content WHERE rowid = old.rowid;
+    END""",
+]
+
+
+def create_search_index(sync_conn) -> bool:
+    """Create the search index and its sync machinery (idempotent).
+
+    Returns True when the index is new or older than SEARCH_INDEX_VERSION, i.e.
+    offloaded messages must be reindexed with `index_full_text`.
+    """
+    sync_conn.execute(text("CREATE TABLE IF NOT EXISTS search_index_version (version INTEGER NOT NULL)"))
+    version = sync_conn.execute(text("SELECT max(version) FROM search_index_version")).scalar()
+    if sync_conn.dialect.name == "sqlite":
+        exists = sync_conn.execute(
+            text("SELECT 1 FROM sqlite_master WHERE name = 'messages_fts'")
+        ).first()
+        for ddl in _SQLITE_DDL:
+            sync_conn.execute(text(ddl))
+        if not exists:
+            # Backfill messages written before the index existed.
+            sync_conn.execute(text(
+                "INSERT INTO messages_fts(rowid, content, message_id) SELECT rowid, content, id FROM messages"
+            ))
+    else:
+        for ddl in _PG_DDL:
+            sync_conn.execute(text(ddl))
+    if version == SEARCH_INDEX_VERSION:
+        return False
+    sync_conn.execute(text("DELETE FROM search_index_version"))
+    sync_conn.execute(text("INSERT INTO search_index_version (version) VALUES (:v)"), {"v": SEARCH_INDEX_VERSION})
+    return True
+
+
+async def index_full_text(db: AsyncSession, message_id: str, content: str):
+    """Index an offloaded message's full text instead of its excerpt. Call after the row is flushed."""
+    if db.bind.dialect.name == "sqlite":
+        await db.execute(
+            text("UPDATE messages_fts SET content = :content WHERE rowid = (SELECT rowid FROM messages WHERE id = :id)"),
+            {"content": content, "id": message_id},
+        )
+    else:
+        await db.execute(
+            text(f"UPDATE messages SET search_vector = to_tsvector('english'::regconfig, left(:content, {PG_INDEXED_CHARS})) WHERE id = :id"),
+            {"content": content, "id": message_id},
+        )
+
+
+def _fts5_query(q: str) -> str:
+    """Turn free text into a safe FTS5 query: quoted terms, all required, last one as a prefix."""
+    terms = re.findall(r"\w+", q)
+    if not terms:
+        return ""
+    quoted = [f'"{t}"' for t in terms]
+    quoted[-1] += "*"
+    return " ".join(quoted)
+
+
+async def search_messages(
+    db: AsyncSession, q: str, limit: int, offset: int = 0, session_id: str | None = None
+) -> list[dict]:
+    """Return up to `limit` ranked hits starting at `offset`, best first."""
+    params = {"limit": limit, "offset": offset, "session_id": session_id}
+    session_filter = "AND m.session_id = :session_id" if session_id else ""
+
+    if db.bind.dialect.name == "sqlite":
+        params["q"] = _fts5_query(q)
+        if not params["q"]:
+            return []
+        sql = f"""
+            SELECT m.id, m.session_id, m.role, m.created_at, s.title, hit.rank, hit.snippet
+            FROM (
+                SELECT f.message_id, bm25(messages_fts) AS rank,
+                       snippet(messages_fts, 0, '{SNIPPET_START}', '{SNIPPET_STOP}', '…', 24) AS snippet
+                FROM messages_fts f JOIN messages m ON m.id = f.message_id
+                WHERE messages_fts MATCH :q {session_filter}
+                ORDER BY rank, f.message_id
+                LIMIT :limit OFFSET :offset
+            ) hit
+            JOIN messages m ON m.id = hit.message_id
+            JOIN sessions s ON s.id = m.session_id
+            ORDER BY hit.rank, m.id
+        """
+    else:
+        params["q"] = q
+        sql = f"""
+            SELECT m.id, m.session_id, m.role, m.created_at, s.title, hit.rank,
+                   ts_headline('english', left(m.content, {PG_INDEXED_CHARS}), hit.query,
+                               'StartSel={SNIPPET_START}, StopSel={SNIPPET_STOP}, MaxFragments=2, MaxWords=24, MinWords=8')
+                   AS snippet
+            FROM (
+                SELECT m.id, ts_rank(m.search_vector, query) AS rank, query
+                FROM messages m, websearch_to_tsquery('english', :q) query
+                WHERE m.search_vector @@ query {session_filter}
+                ORDER BY rank DESC, m.id
+                LIMIT :limit OFFSET :offset
+            ) hit
+            JOIN messages m ON m.id = hit.id
+            JOIN sessions s ON s.id = m.session_id
+            ORDER BY hit.rank DESC, m.id
+        """
+
+    result = await db.execute(text(sql).columns(created_at=DateTime(timezone=True)), params)
+    hits = []
+    for row in result.mappings():
+        hits.append({
+            "messageId": row["id"],
+            "sessionId": row["session_id"],
+            "sessionTitle": row["title"],
+            "role": row["role"],
+            "createdAt": row["created_at"].isoformat() if row["created_at"] else None,
+            "snippet": row["snippet"],
+            # bm25() is lower-is-better; flip it so higher is better on both backends.
+            "score": round(-row["rank"] if db.bind.dialect.name == "sqlite" else row["rank"], 4),
+        })
+    return hits
@@ -0,0 +1,158 @@
+"""Memory-mapped columnar snapshot of the 311 dataset, shared by every process.
+
+`download_311` publishes each refresh as a new versioned directory of NumPy
+`.npy` files, one per column:
+
+- `*_date` columns are datetime64[s] (NaT for missing).
+- Numeric columns are stored as they are.
+- Everything else is dictionary-encoded: int32 codes (-1 for missing) plus a
+  `<column>.dict.json` list of values.
+
+`CURRENT` names the live version and is swapped with an atomic rename while
+holding the snapshot lock. Readers (uvicorn workers, host tools, agent scripts)
+open the arrays with `mmap_mode="r"`, so they share one copy in the page cache
+instead of each parsing the CSV. A reader keeps its mapping of an old version
+until it reopens; SNAPSHOT_KEEP versions stay on disk for readers mid-switch.
+"""
+
+import json
+import os
+import shutil
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from agent311 import coordination
+
+_volume_mount = os.environ.get("RAILWAY_VOLUME_MOUNT_PATH", str(Path(__file__).resolve().parent.parent / "data"))
+SNAPSHOT_ROOT = Path(_volume_mount) / "snapshot"
+CURRENT_FILENAME = "CURRENT"
+SNAPSHOT_KEEP = int(os.environ.get("SNAPSHOT_KEEP", "2"))
+
+
+def _encode(name: str, col: pd.Series) -> tuple[str, np.ndarray, list | None]:
+    if name.endswith("_date"):
+        values = pd.to_datetime(col, errors="coerce").to_numpy(dtype="datetime64[s]")
+        return "date", values, None
+    if pd.api.types.is_numeric_dtype(col) and not pd.api.types.is_bool_dtype(col):
+        return "number", col.to_numpy(), None
+    codes, uniques = pd.factorize(col.astype(object).where(col.notna(), None), use_na_sentinel=True)
+    return "category", codes.astype(np.int32), [str(v) for v in uniques]
+
+
+def _write_version(df: pd.DataFrame, directory: Path) -> dict:
+    directory.mkdir(parents=True)
+    columns = []
+    for name in df.columns:
+        kind, values, categories = _encode(name, df[name])
+        np.save(directory / f"{name}.npy", values, allow_pickle=False)
+        if categories is not None:
+            (directory / f"{name}.dict.json").write_text(json.dumps(categories))
+        columns.append({"name": name, "kind": kind, "dtype": str(values.dtype)})
+    meta = {
+        "version": directory.name,
+        "rows": len(df),
+        "createdAt": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "columns": columns,
+    }
+    (directory / "meta.json").write_text(json.dumps(meta, indent=1))
+    for path in directory.iterdir():
+        with open(path, "rb") as f:
+            os.fsync(f.fileno())
+    return meta
+
+
+def publish(df: pd.DataFrame, root: Path | None = None) -> Path:
+    """Write df as a new version and make it current. Returns the version directory."""
+    root = root or SNAPSHOT_ROOT
+    root.mkdir(parents=True, exist_ok=True)
+    fd = coordination.lock(root / ".lock")
+    try:
+        version = datetime.now(timezone.utc).strftime("v%Y%m%dT%H%M%S") + f"-{os.getpid()}"
+        directory = root / version
+        _write_version(df, directory)
+        tmp = root / f".{CURRENT_FILENAME}.tmp"
+        tmp.write_text(version)
+        os.replace(tmp, root / CURRENT_FILENAME)
+
+        versions = sorted(p for p in root.iterdir() if p.is_dir() and p.name.startswith("v"))
+        for old in versions[:-SNAPSHOT_KEEP]:
+            if old.name != version:
+                shutil.rmtree(old, ignore_errors=True)
+    finally:
+        coordination.release(fd)
+    return directory
+
+
+class Snapshot:
+    """One published version. Every column is mapped up front, so deleting the
+    version directory later doesn't affect an open Snapshot."""
+
+    def __init__(self, directory: Path):
+        self.directory = directory
+        self.meta = json.loads((directory / "meta.json").read_text())
+        self.version: str = self.meta["version"]
+        self.rows: int = self.meta["rows"]
+        self.kinds = {c["name"]: c["kind"] for c in self.meta["columns"]}
+        self._arrays = {name: np.load(directory / f"{name}.npy", mmap_mode="r") for name in self.kinds}
+        self._categories = {
+            name: np.array(json.loads((directory / f"{name}.dict.json").read_text()), dtype=object)
+            for name, kind in self.kinds.items() if kind == "category"
+        }
+
+    @property
+    def columns(self) -> list[str]:
+        return list(self.kinds)
+
+    def array(self, name: str) -> np.ndarray:
+        """Raw mapped values: dates, numbers, or category codes."""
+        return self._arrays[name]
+
+    def categories(self, name: str) -> np.ndarray:
+        return self._categories[name]
+
+    def column(self, name: str, rows: slice | np.ndarray | None = None) -> pd.Series:
+        values = self._arrays[name] if rows is None else self._arrays[name][rows]
+        if self.kinds[name] == "category":
+            return pd.Series(pd.Categorical.from_codes(values, categories=self._categories[name]), name=name)
+        return pd.Series(values, name=name, copy=False)
+
+    def frame(self, columns: list[str] | None = None, rows: slice | np.ndarray | None = None) -> pd.DataFrame:
+        return pd.DataFrame({name: self.column(name, rows) for name in columns or self.columns})
+
+    def stats(self) -> dict:
+        return {
+            "version": self.version,
+            "rows": self.rows,
+            "createdAt": self.meta["createdAt"],
+            "mappedBytes": sum(a.nbytes for a in self._arrays.values()),
+        }
+
+
+# root -> (CURRENT mtime_ns, open snapshot)
+_open: dict[Path, tuple[int, Snapshot]] = {}
+
+
+def current(root: Path | None = None) -> Snapshot | None:
+    """The live snapshot, reopened after a new version is published. None before the first."""
+    root = root or SNAPSHOT_ROOT
+    pointer = root / CURRENT_FILENAME
+    try:
+        mtime_ns = pointer.stat().st_mtime_ns
+    except FileNotFoundError:
+        return None
+    cached = _open.get(root)
+    if cached is None or cached[0] != mtime_ns:
+        snapshot = Snapshot(root / pointer.read_text().strip())
+        cached = _open[root] = (mtime_ns, snapshot)
+    return cached[1]
+
+
+def load_frame(columns: list[str] | None = None) -> pd.DataFrame:
+    """The current dataset as a DataFrame, for analysis scripts. Pass columns to map only those."""
+    snapshot = current()
+    if snapshot is None:
+        raise FileNotFoundError("No 311 snapshot has been published yet")
+    return snapshot.frame(columns)
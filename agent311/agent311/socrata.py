@@ -0,0 +1,284 @@
+"""Caching client for SoQL queries against the Austin 311 Socrata dataset.
+
+Queries are normalized (parameter names, whitespace outside string literals,
+default and maximum $limit) so equivalent requests share one cache entry.
+Results are cached as CSV files on the volume for SOCRATA_CACHE_TTL_SECONDS.
+The oldest-used files are evicted once the cache grows past SOCRATA_CACHE_MAX_MB.
+
+Upstream requests share one pooled httpx client. Both limits below hold
+across every worker and process on the volume, not per process:
+
+- The token bucket (SOCRATA_RATE_PER_SECOND) lives in a flock-guarded file
+  under the coordination lock directory.
+- Identical queries in flight share one upstream request. Within a worker they
+  wait on a future. Across workers they wait on a per-key flock, then find the
+  result in the on-disk cache.
+
+Point SOCRATA_BASE_URL at a local server to test without the network.
+"""
+
+import asyncio
+import csv
+import hashlib
+import io
+import json
+import logging
+import os
+import re
+import time
+from pathlib import Path
+
+import httpx
+
+from agent311 import coordination, fileio
+from agent311.download_311 import get_data_dir
+
+logger = logging.getLogger(__name__)
+
+SOCRATA_BASE_URL = os.environ.get("SOCRATA_BASE_URL", "https://data.austintexas.gov").rstrip("/")
+SOCRATA_DATASET = os.environ.get("SOCRATA_DATASET", "xwdj-i9he")
+SOCRATA_APP_TOKEN = os.environ.get("SOCRATA_APP_TOKEN")
+SOCRATA_TIMEOUT_SECONDS = float(os.environ.get("SOCRATA_TIMEOUT_SECONDS", "60"))
+SOCRATA_RATE_PER_SECOND = float(os.environ.get("SOCRATA_RATE_PER_SECOND", "2"))
+SOCRATA_RATE_BURST = int(os.environ.get("SOCRATA_RATE_BURST", "4"))
+SOCRATA_CACHE_TTL_SECONDS = int(os.environ.get("SOCRATA_CACHE_TTL_SECONDS", str(24 * 3600)))
+SOCRATA_CACHE_MAX_BYTES = int(os.environ.get("SOCRATA_CACHE_MAX_MB", "256")) * 1024 * 1024
+SOCRATA_DEFAULT_LIMIT = 1000
+SOCRATA_MAX_LIMIT = int(os.environ.get("SOCRATA_MAX_LIMIT", "50000"))
+# How much of a result is returned inline to the agent; the rest stays in the cache file.
+SOCRATA_RESULT_CHARS = int(os.environ.get("SOCRATA_RESULT_CHARS", "40000"))
+CACHE_DIR = get_data_dir() / "socrata_cache"
+RATE_STATE_PATH = coordination.LOCK_DIR / "socrata-rate"
+# Per-query fetch locks are striped over a fixed set of files so they don't pile up.
+FETCH_LOCK_STRIPES = 64
+FETCH_LOCK_POLL_SECONDS = 0.1
+
+SOQL_PARAMS = ("select", "where", "group", "having", "order", "limit", "offset", "q")
+
+
+class SocrataError(Exception):
+    pass
+
+
+def _collapse_whitespace(clause: str) -> str:
+    """Collapse runs of whitespace, leaving single-quoted SoQL literals untouched."""
+    parts = re.split(r"('(?:[^']|'')*')", clause.strip())
+    return "".join(p if p.startswith("'") else re.sub(r"\s+", " ", p) for p in parts)
+
+
+def normalize(params: dict) -> dict[str, str]:
+    """Canonical SoQL parameters ({"$where": ...}) for a tool call's arguments."""
+    normalized = {}
+    for key, value in params.items():
+        name = key.lstrip("$").lower()
+        if name not in SOQL_PARAMS:
+            raise SocrataError(f"Unsupported parameter '{key}'. Allowed: {', '.join('$' + p for p in SOQL_PARAMS)}")
+        if value is None or str(value).strip() == "":
+            continue
+        normalized[f"${name}"] = _collapse_whitespace(str(value))
+
+    try:
+        limit = int(normalized.get("$limit", SOCRATA_DEFAULT_LIMIT))
+        offset = int(normalized.get("$offset", 0))
+    except ValueError:
+        raise SocrataError("$limit and $offset must be integers")
+    if limit < 1 or offset < 0:
+        raise SocrataError("$limit must be positive and $offset non-negative")
+    normalized["$limit"] = str(min(limit, SOCRATA_MAX_LIMIT))
+    if offset:
+        normalized["$offset"] = str(offset)
+    else:
+        normalized.pop("$offset", None)
+    return dict(sorted(normalized.items()))
+
+
+def count_rows(text: str) -> int:
+    """Data rows in a CSV response; quoted fields may span lines."""
+    return max(sum(1 for row in csv.reader(io.StringIO(text)) if row) - 1, 0)
+
+
+def cache_key(params: dict[str, str]) -> str:
+    raw = json.dumps([SOCRATA_DATASET, params], separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32]
+
+
+def _take_token(path: Path, rate: float, capacity: int) -> float:
+    """Take a token from the shared bucket file. Returns 0, or the seconds to wait before retrying."""
+    fd = coordination.lock(path)
+    try:
+        now = time.time()
+        try:
+            tokens, updated = map(float, os.pread(fd, 64, 0).split())
+        except ValueError:  # new or unreadable file: start full
+            tokens, updated = float(capacity), now
+        tokens = min(capacity, tokens + max(0.0, now - updated) * rate)
+        wait = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            wait = (1 - tokens) / rate
+        state = f"{tokens:.6f} {now:.6f}".encode()
+        os.pwrite(fd, state, 0)
+        os.ftruncate(fd, len(state))
+        return wait
+    finally:
+        coordination.release(fd)
+
+
+class _TokenBucket:
+    """Token bucket shared by every process through a flock-guarded state file."""
+
+    def __init__(self, rate: float, burst: int, path: Path = RATE_STATE_PATH):
+        self.rate = rate
+        self.capacity = burst
+        self.path = path
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        # Callers in this worker queue here, so only one at a time polls the file.
+        async with self._lock:
+            while (wait := await fileio.run(_take_token, self.path, self.rate, self.capacity)) > 0:
+                await asyncio.sleep(wait)
+
+
+def _read_cached(path: Path) -> bytes | None:
+    try:
+        st = path.stat()
+    except FileNotFoundError:
+        return None
+    if time.time() - st.st_mtime > SOCRATA_CACHE_TTL_SECONDS:
+        return None
+    data = path.read_bytes()
+    # Bump atime (the LRU clock) but keep mtime, which is the fetch time.
+    os.utime(path, (time.time(), st.st_mtime))
+    return data
+
+
+def _evict(directory: Path, max_bytes: int) -> int:
+    """Remove expired entries, then least recently used ones until under max_bytes."""
+    entries = []
+    now = time.time()
+    removed = 0
+    for entry in os.scandir(directory):
+        if not entry.name.endswith(".csv"):
+            continue
+        st = entry.stat()
+        if now - st.st_mtime > SOCRATA_CACHE_TTL_SECONDS:
+            Path(entry.path).unlink(missing_ok=True)
+            removed += 1
+        else:
+            entries.append((st.st_atime, st.st_size, entry.path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        Path(path).unlink(missing_ok=True)
+        total -= size
+        removed += 1
+    return removed
+
+
+class SocrataClient:
+    def __init__(self, base_url: str = SOCRATA_BASE_URL, cache_dir: Path = CACHE_DIR):
+        self.url = f"{base_url}/resource/{SOCRATA_DATASET}.csv"
+        self.cache_dir = cache_dir
+        self.lock_dir = coordination.LOCK_DIR / "socrata"
+        self._http: httpx.AsyncClient | None = None
+        self._bucket = _TokenBucket(SOCRATA_RATE_PER_SECOND, SOCRATA_RATE_BURST)
+        self._inflight: dict[str, asyncio.Future] = {}
+        self._hits = 0
+        self._misses = 0
+        self._coalesced = 0
+        self._errors = 0
+        self._evicted = 0
+
+    def _client(self) -> httpx.AsyncClient:
+        if self._http is None:
+            headers = {"X-App-Token": SOCRATA_APP_TOKEN} if SOCRATA_APP_TOKEN else {}
+            self._http = httpx.AsyncClient(
+                headers=headers,
+                timeout=SOCRATA_TIMEOUT_SECONDS,
+                limits=httpx.Limits(max_connections=8, max_keepalive_connections=4),
+            )
+        return self._http
+
+    async def close(self):
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+    async def query(self, params: dict) -> tuple[bytes, Path, bool]:
+        """Run a SoQL query. Returns (CSV bytes, cache file, served from cache)."""
+        normalized = normalize(params)
+        key = cache_key(normalized)
+        path = self.cache_dir / f"{key}.csv"
+
+        data = await fileio.run(_read_cached, path)
+        if data is not None:
+            self._hits += 1
+            return data, path, True
+
+        pending = self._inflight.get(key)
+        if pending is not None:
+            self._coalesced += 1
+            return await asyncio.shield(pending), path, True
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            data, fetched = await self._fetch_once(normalized, key, path)
+            future.set_result(data)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as exc:
+            future.set_exception(exc)
+            # Waiters see the error; this stops "exception never retrieved" when there are none.
+            future.exception()
+            raise
+        finally:
+            del self._inflight[key]
+        return data, path, not fetched
+
+    async def _fetch_once(self, params: dict[str, str], key: str, path: Path) -> tuple[bytes, bool]:
+        """Fetch and cache a query unless another worker does it first. Returns (data, fetched here)."""
+        lock_path = self.lock_dir / f"{int(key[:8], 16) % FETCH_LOCK_STRIPES}.lock"
+        # Poll rather than block, so waiting doesn't tie up a file I/O thread.
+        while (fd := await fileio.run(coordination.try_lock, lock_path)) is None:
+            await asyncio.sleep(FETCH_LOCK_POLL_SECONDS)
+        try:
+            data = await fileio.run(_read_cached, path)
+            if data is not None:
+                self._coalesced += 1
+                return data, False
+            self._misses += 1
+            data = await self._fetch(params)
+            await fileio.run(self.cache_dir.mkdir, parents=True, exist_ok=True)
+            await fileio.write_atomic(path, data)
+            self._evicted += await fileio.run(_evict, self.cache_dir, SOCRATA_CACHE_MAX_BYTES)
+            return data, True
+        finally:
+            coordination.release(fd)
+
+    async def _fetch(self, params: dict[str, str]) -> bytes:
+        await self._bucket.acquire()
+        logger.info(f"Socrata query: {params}")
+        try:
+            response = await self._client().get(self.url, params=params)
+        except httpx.HTTPError as exc:
+            self._errors += 1
+            raise SocrataError(f"Socrata request failed: {exc}") from exc
+        if response.status_code != 200:
+            self._errors += 1
+            raise SocrataError(f"Socrata returned HTTP {response.status_code}: {response.text[:500]}")
+        return response.content
+
+    def stats(self) -> dict:
+        return {
+            "hits": self._hits,
+            "misses": self._misses,
+            "coalesced": self._coalesced,
+            "errors": self._errors,
+            "evicted": self._evicted,
+            "inFlight": len(self._inflight),
+        }
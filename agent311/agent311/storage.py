@@ -0,0 +1,260 @@
+"""Volume quota manager for reports, charts and per-run agent scratch space.
+
+Byte totals per directory come from the artifact index. When a directory goes
+over its quota, the least recently used unpinned artifacts are evicted until it
+is back under STORAGE_LOW_WATERMARK of the quota. Reports the agent saves are
+evictable like charts; an artifact is kept only if it was uploaded, kept by the
+user (PATCH /api/reports/{name} with pinned), or a favorite session refers to it. References are looked up in the full text of each message, including
+bodies offloaded to message_bodies.
+
+Last-access times are recorded in memory by the download and preview endpoints
+and written in bulk at the start of each sweep, so reads don't each cost a
+database write.
+
+Each agent run gets its own scratch directory under AGENT_SCRATCH_ROOT. It is
+removed when the run ends. While the run lasts, its worker holds a lock on the
+directory's `.active` file, so any worker's sweep can tell it from one orphaned
+by a crash. Orphans are removed once they are older than SCRATCH_MAX_AGE_SECONDS
+or when the scratch quota is exceeded.
+
+With several workers every one of them flushes its own access times, but only
+the elected leader runs sweeps.
+"""
+
+import asyncio
+import logging
+import os
+import shutil
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+from sqlalchemy import delete, func, select, update
+
+from agent311 import coordination, fileio, previews
+from agent311.coordination import LeaderElection
+from agent311.db import Artifact, Message, Session, get_async_session
+from agent311.message_store import load_full_contents
+
+logger = logging.getLogger(__name__)
+
+_MB = 1024 * 1024
+QUOTAS = {
+    "report": int(os.environ.get("REPORTS_QUOTA_MB", "1024")) * _MB,
+    "chart": int(os.environ.get("CHARTS_QUOTA_MB", "512")) * _MB,
+}
+SCRATCH_QUOTA_BYTES = int(os.environ.get("SCRATCH_QUOTA_MB", "512")) * _MB
+SCRATCH_MAX_AGE_SECONDS = int(os.environ.get("SCRATCH_MAX_AGE_SECONDS", str(6 * 3600)))
+AGENT_SCRATCH_ROOT = Path(os.environ.get("AGENT_SCRATCH_ROOT", os.path.join(tempfile.gettempdir(), "agent311")))
+STORAGE_SWEEP_INTERVAL_SECONDS = int(os.environ.get("STORAGE_SWEEP_INTERVAL_SECONDS", "600"))
+# After evicting, usage is brought down to this fraction of the quota.
+STORAGE_LOW_WATERMARK = float(os.environ.get("STORAGE_LOW_WATERMARK", "0.9"))
+ACTIVE_MARKER = ".active"
+
+
+def _dir_size(path: Path) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except FileNotFoundError:
+                pass
+    return total
+
+
+def _scratch_dirs() -> list[tuple[Path, float, int, bool]]:
+    """(path, mtime, bytes, in use by a live run) of each run directory, oldest first."""
+    if not AGENT_SCRATCH_ROOT.exists():
+        return []
+    dirs = []
+    with os.scandir(AGENT_SCRATCH_ROOT) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                path = Path(entry.path)
+                active = coordination.is_held(path / ACTIVE_MARKER)
+                dirs.append((path, entry.stat(follow_symlinks=False).st_mtime, _dir_size(path), active))
+    return sorted(dirs, key=lambda d: d[1])
+
+
+def _delete_file(path: Path):
+    path.unlink(missing_ok=True)
+    previews.remove_thumbnail(path)
+
+
+class StorageManager:
+    """Tracks artifact usage and enforces per-directory quotas."""
+
+    def __init__(self, quotas: dict[str, int] | None = None, interval: int = STORAGE_SWEEP_INTERVAL_SECONDS,
+                 leader: LeaderElection | None = None):
+        self.quotas = QUOTAS if quotas is None else quotas
+        self.interval = interval
+        # Without an election (single worker) this process always sweeps.
+        self.leader = leader
+        self._accessed: dict[str, datetime] = {}
+        # run directory -> fd holding its ACTIVE_MARKER lock
+        self._active_scratch: dict[Path, int] = {}
+        self._task: asyncio.Task | None = None
+        self._sweeps = 0
+        self._evicted_files = 0
+        self._evicted_bytes = 0
+        self._scratch_removed = 0
+        self._usage: dict[str, int] = {}
+
+    def start(self):
+        if self._task is None:
+            AGENT_SCRATCH_ROOT.mkdir(parents=True, exist_ok=True)
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        await self._flush_access_times()
+
+    def touch(self, path: Path | str):
+        """Note that an artifact (by its index path) was just read."""
+        self._accessed[str(path)] = datetime.now(timezone.utc)
+
+    # ─── Scratch directories ──────────────────────────────────────────────
+
+    async def create_scratch_dir(self) -> Path:
+        path = Path(await fileio.run(tempfile.mkdtemp, prefix="run-", dir=AGENT_SCRATCH_ROOT))
+        self._active_scratch[path] = await fileio.run(coordination.hold, path / ACTIVE_MARKER)
+        return path
+
+    def _release_scratch(self, path: Path):
+        fd = self._active_scratch.pop(path, None)
+        if fd is not None:
+            coordination.release(fd)
+
+    async def remove_scratch_dir(self, path: Path):
+        self._release_scratch(path)
+        await fileio.run(shutil.rmtree, path, ignore_errors=True)
+        self._scratch_removed += 1
+
+    async def _sweep_scratch(self):
+        cutoff = time.time() - SCRATCH_MAX_AGE_SECONDS
+        # No run lasts SCRATCH_MAX_AGE_SECONDS, so an "active" directory that old was abandoned.
+        dirs = [d for d in await fileio.run(_scratch_dirs) if not d[3] or d[1] < cutoff]
+        total = sum(size for _, _, size, _ in dirs)
+        for path, mtime, size, _ in dirs:
+            if mtime >= cutoff and total <= SCRATCH_QUOTA_BYTES:
+                break
+            self._release_scratch(path)
+            await fileio.run(shutil.rmtree, path, ignore_errors=True)
+            self._scratch_removed += 1
+            total -= size
+        self._usage["scratch"] = total
+
+    # ─── Artifact quotas ──────────────────────────────────────────────────
+
+    async def _flush_access_times(self):
+        accessed, self._accessed = self._accessed, {}
+        if not accessed:
+            return
+        async with get_async_session()() as db:
+            for path, at in accessed.items():
+                await db.execute(update(Artifact).where(Artifact.path == path).values(last_accessed_at=at))
+            await db.commit()
+
+    async def _referenced_by_favorites(self, db, path: str) -> bool:
+        result = await db.execute(
+            select(Message.id)
+            .join(Session, Session.id == Message.session_id)
+            .where(Session.is_favorite == True)  # noqa: E712
+            .where(Message.is_offloaded == False)  # noqa: E712
+            .where(Message.content.contains(path, autoescape=True))
+            .limit(1)
+        )
+        return result.first() is not None
+
+    async def _offloaded_favorite_texts(self, db) -> list[str]:
+        """Full text of offloaded messages in favorite sessions; `content` holds only an excerpt."""
+        result = await db.execute(
+            select(Message)
+            .join(Session, Session.id == Message.session_id)
+            .where(Session.is_favorite == True)  # noqa: E712
+            .where(Message.is_offloaded == True)  # noqa: E712
+        )
+        messages = result.scalars().all()
+        return list((await load_full_contents(db, messages)).values()) if messages else []
+
+    async def _enforce_quota(self, kind: str, quota: int):
+        async with get_async_session()() as db:
+            used = (await db.execute(
+                select(func.coalesce(func.sum(Artifact.size_bytes), 0)).where(Artifact.kind == kind)
+            )).scalar_one()
+            self._usage[kind] = used
+            if used <= quota:
+                return
+
+            target = int(quota * STORAGE_LOW_WATERMARK)
+            last_used = func.coalesce(Artifact.last_accessed_at, Artifact.modified_at)
+            result = await db.execute(
+                select(Artifact.path, Artifact.size_bytes)
+                .where(Artifact.kind == kind)
+                .where(Artifact.pinned == False)  # noqa: E712
+                .order_by(last_used, Artifact.path)
+            )
+            victims = []
+            offloaded_texts = None  # loaded once, only if something is to be evicted
+            for path, size in result.all():
+                if used <= target:
+                    break
+                if await self._referenced_by_favorites(db, path):
+                    continue
+                if offloaded_texts is None:
+                    offloaded_texts = await self._offloaded_favorite_texts(db)
+                if any(path in text for text in offloaded_texts):
+                    continue
+                victims.append((path, size))
+                used -= size
+
+            for path, size in victims:
+                await fileio.run(_delete_file, Path(path))
+                fileio.forget(path)
+                self._evicted_files += 1
+                self._evicted_bytes += size
+            if victims:
+                await db.execute(delete(Artifact).where(Artifact.path.in_([p for p, _ in victims])))
+                await db.commit()
+                logger.info(f"Evicted {len(victims)} {kind} artifacts; {used} of {quota} bytes in use")
+            self._usage[kind] = used
+            if used > quota:
+                logger.warning(f"{kind} storage is over quota ({used} > {quota} bytes) with only pinned artifacts left")
+
+    async def sweep(self):
+        await self._flush_access_times()
+        for kind, quota in self.quotas.items():
+            await self._enforce_quota(kind, quota)
+        await self._sweep_scratch()
+        self._sweeps += 1
+
+    async def _run(self):
+        while True:
+            try:
+                if self.leader is None or self.leader.is_leader:
+                    await self.sweep()
+                else:
+                    await self._flush_access_times()
+            except Exception:
+                logger.exception("Storage sweep failed")
+            await asyncio.sleep(self.interval)
+
+    def stats(self) -> dict:
+        return {
+            "usageBytes": dict(self._usage),
+            "quotaBytes": {**self.quotas, "scratch": SCRATCH_QUOTA_BYTES},
+            "sweeps": self._sweeps,
+            "evictedFiles": self._evicted_files,
+            "evictedBytes": self._evicted_bytes,
+            "activeScratchDirs": len(self._active_scratch),
+            "scratchDirsRemoved": self._scratch_removed,
+        }
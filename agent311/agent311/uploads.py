@@ -0,0 +1,162 @@
+"""Streaming multipart uploads, written and hashed once.
+
+`request.form()` spools every file part to a temporary file before the handler
+sees it, so the bytes would be written once by Starlette and then again when
+copied into place. `receive_file` feeds `request.stream()` to python-multipart's
+push parser instead: the data of the "file" part is hashed and written straight
+into a temp file in the destination directory. Writes go through the file I/O
+pool in UPLOAD_CHUNK_BYTES batches.
+"""
+
+import hashlib
+import os
+import tempfile
+from collections.abc import Callable
+from pathlib import Path
+
+from python_multipart.exceptions import MultipartParseError
+from python_multipart.multipart import MultipartParser, parse_options_header
+from starlette.requests import Request
+
+from agent311 import fileio
+
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+
+
+class UploadError(ValueError):
+    pass
+
+
+class UploadTooLarge(UploadError):
+    pass
+
+
+class _FileSink:
+    """Temp file for the file part; hashes and writes on the I/O pool."""
+
+    def __init__(self, directory: Path):
+        fd, tmp_name = tempfile.mkstemp(dir=directory, prefix=".upload-", suffix=".tmp")
+        self.path = Path(tmp_name)
+        self._file = os.fdopen(fd, "wb")
+        self._digest = hashlib.sha256()
+
+    def _write(self, data: bytes):
+        self._digest.update(data)
+        self._file.write(data)
+
+    async def write(self, data: bytes):
+        await fileio.run(self._write, data)
+
+    async def finish(self) -> str:
+        await fileio.run(self._file.close)
+        return self._digest.hexdigest()
+
+    def discard(self):
+        self._file.close()
+        self.path.unlink(missing_ok=True)
+
+
+async def receive_file(
+    request: Request,
+    directory: Path,
+    max_file_bytes: int,
+    max_body_bytes: int,
+    check_filename: Callable[[str], None],
+    field: str = "file",
+) -> tuple[str, Path, int, str]:
+    """Stream the `field` part of a multipart body into a temp file in directory.
+
+    check_filename runs on the part's filename before any data is written and
+    may raise to reject it. Returns (filename, temp path, size, sha256); the
+    caller moves the temp file into place.
+    """
+    _, params = parse_options_header(request.headers.get("content-type"))
+    boundary = params.get(b"boundary")
+    if not boundary:
+        raise UploadError("Expected a multipart/form-data body")
+
+    headers: dict[bytes, bytes] = {}
+    header_field = bytearray()
+    header_value = bytearray()
+    state = {"in_file": False, "filename": None, "size": 0, "complete": False}
+    sink: _FileSink | None = None
+    pending = bytearray()
+
+    def on_part_begin():
+        headers.clear()
+
+    def on_header_field(data: bytes, start: int, end: int):
+        header_field.extend(data[start:end])
+
+    def on_header_value(data: bytes, start: int, end: int):
+        header_value.extend(data[start:end])
+
+    def on_header_end():
+        headers[bytes(header_field).lower()] = bytes(header_value)
+        header_field.clear()
+        header_value.clear()
+
+    def on_headers_finished():
+        _, disposition = parse_options_header(headers.get(b"content-disposition"))
+        state["in_file"] = disposition.get(b"name") == field.encode()
+        if state["in_file"]:
+            if state["filename"] is not None:
+                raise UploadError(f"Only one '{field}' part is allowed")
+            filename = disposition.get(b"filename")
+            if not filename:
+                raise UploadError("No filename provided")
+            state["filename"] = filename.decode("utf-8", "replace")
+            check_filename(state["filename"])
+
+    def on_part_data(data: bytes, start: int, end: int):
+        if state["in_file"]:
+            pending.extend(data[start:end])
+            state["size"] += end - start
+            if state["size"] > max_file_bytes:
+                raise UploadTooLarge(f"Upload exceeds {max_file_bytes} bytes")
+
+    def on_part_end():
+        state["in_file"] = False
+
+    def on_end():
+        state["complete"] = True
+
+    parser = MultipartParser(boundary, {
+        "on_part_begin": on_part_begin,
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+        "on_part_data": on_part_data,
+        "on_part_end": on_part_end,
+        "on_end": on_end,
+    })
+
+    received = 0
+    done = False
+    try:
+        async for chunk in request.stream():
+            received += len(chunk)
+            if received > max_body_bytes:
+                raise UploadTooLarge(f"Upload exceeds {max_file_bytes} bytes")
+            parser.write(chunk)
+            if state["filename"] is not None and sink is None:
+                sink = await fileio.run(_FileSink, directory)
+            if sink is not None and len(pending) >= UPLOAD_CHUNK_BYTES:
+                await sink.write(bytes(pending))
+                pending.clear()
+        parser.finalize()
+        if not state["complete"]:
+            raise UploadError("Incomplete multipart body")
+        if sink is None:
+            raise UploadError(f"Missing '{field}' field")
+        if pending:
+            await sink.write(bytes(pending))
+        sha256 = await sink.finish()
+        done = True
+    except MultipartParseError as exc:
+        raise UploadError(f"Malformed multipart body: {exc}") from exc
+    finally:
+        if not done and sink is not None:
+            await fileio.run(sink.discard)
+    return state["filename"], sink.path, state["size"], sha256
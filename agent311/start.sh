@@ -4,4 +4,6 @@ set -e
 # Download/update Austin 311 data (Jan 1 of last year to present)
 uv run python -m agent311.download_311
 
-uv run uvicorn agent311.main:app --host 0.0.0.0 --port ${PORT:-8000}
+# Workers share the mapped dataset snapshot and elect one leader for background sweeps.
+# Trust the platform proxy's X-Forwarded-* headers so request URLs (export links) are https.
+uv run uvicorn agent311.main:app --host 0.0.0.0 --port ${PORT:-8000} --workers ${WEB_CONCURRENCY:-1} --forwarded-allow-ips '*'
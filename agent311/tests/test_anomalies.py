@@ -0,0 +1,42 @@
+import pandas as pd
+
+from agent311 import anomalies, download_311, resolution
+
+
+def _requests(days: int) -> pd.DataFrame:
+    created = pd.date_range("2025-06-01T08:00:00", periods=days * 4, freq="6h")
+    return pd.DataFrame({
+        "sr_number": [f"SR{i}" for i in range(len(created))],
+        "sr_type_desc": "Pothole",
+        "sr_department_desc": "TPW",
+        "sr_status_desc": "Open",
+        "sr_location_council_district": 3.0,
+        "sr_created_date": created.strftime("%Y-%m-%dT%H:%M:%S.000"),
+        "sr_updated_date": created.strftime("%Y-%m-%dT%H:%M:%S.000"),
+        "sr_closed_date": None,
+    })
+
+
+def test_empty_delta_leaves_state_unchanged(tmp_path):
+    full = _requests(10)
+    state = anomalies.update(tmp_path, full, full)
+    scored = state.scored_through
+
+    # download() returns a frame without columns when nothing changed.
+    state = anomalies.update(tmp_path, pd.DataFrame(), full)
+    assert state.scored_through == scored
+
+
+def test_ingest_without_changes_skips_state_updates(tmp_path, monkeypatch):
+    full = _requests(10)
+    full.to_csv(tmp_path / "311_recent.csv", index=False)
+    resolution.update(tmp_path, full, full)
+    anomalies.update(tmp_path, full, full)
+    state_path = tmp_path / anomalies.STATE_FILENAME
+    mtime = state_path.stat().st_mtime_ns
+
+    monkeypatch.setattr(download_311, "get_data_dir", lambda: tmp_path)
+    monkeypatch.setattr(download_311, "download", lambda where, label="": pd.DataFrame())
+    download_311.main()
+
+    assert state_path.stat().st_mtime_ns == mtime
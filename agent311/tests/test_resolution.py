@@ -0,0 +1,62 @@
+import pandas as pd
+
+from agent311 import resolution
+
+
+def _rows(*rows):
+    return pd.DataFrame([
+        {
+            "sr_number": number,
+            "sr_type_desc": "Pothole",
+            "sr_department_desc": "TPW",
+            "sr_location_council_district": 3.0,
+            "sr_created_date": created,
+            "sr_closed_date": closed,
+        }
+        for number, created, closed in rows
+    ])
+
+
+def _closed_count(state):
+    return state.summary()["closedCount"]
+
+
+def test_late_row_closed_before_previous_closures_is_counted(tmp_path):
+    # Run 1 counts A, which closed late in the day. Socrata publishes B in the
+    # next run, although B closed before A did.
+    first = _rows(("A", "2025-06-01T09:00:00", "2025-06-01T23:00:00"))
+    resolution.update(tmp_path, first, first)
+
+    delta = _rows(("B", "2025-06-01T10:00:00", "2025-06-01T10:30:00"))
+    full = pd.concat([delta, first])
+    state = resolution.update(tmp_path, delta, full, first["sr_number"])
+
+    assert _closed_count(state) == 2
+
+
+def test_closure_is_counted_once(tmp_path):
+    first = _rows(
+        ("A", "2025-06-01T09:00:00", "2025-06-01T23:00:00"),
+        ("B", "2025-06-01T10:00:00", None),
+    )
+    resolution.update(tmp_path, first, first)
+    assert resolution.load(tmp_path / resolution.STATE_FILENAME).summary()["openCount"] == 1
+
+    # B closes; A comes back in the updates query without having changed.
+    changed = _rows(
+        ("B", "2025-06-01T10:00:00", "2025-06-02T10:00:00"),
+        ("A", "2025-06-01T09:00:00", "2025-06-01T23:00:00"),
+    )
+    state = resolution.update(tmp_path, changed, changed, first["sr_number"])
+    assert _closed_count(state) == 2
+    assert state.summary()["openCount"] == 0
+
+    state = resolution.update(tmp_path, changed, changed, changed["sr_number"])
+    assert _closed_count(state) == 2
+
+
+def test_without_previous_snapshot_state_is_rebuilt(tmp_path):
+    first = _rows(("A", "2025-06-01T09:00:00", "2025-06-01T23:00:00"))
+    resolution.update(tmp_path, first, first)
+    state = resolution.update(tmp_path, first, first)
+    assert _closed_count(state) == 1
@@ -39,8 +39,9 @@ function isFullHtmlDocument(code: string): boolean {
   return trimmed.startsWith("<!doctype") || trimmed.startsWith("<html");
 }
 
-function isDataUrl(code: string): boolean {
-  return code.startsWith("data:image/");
+// Report images arrive as object URLs; data URLs still come from older previews.
+function isImageUrl(code: string): boolean {
+  return code.startsWith("data:image/") || code.startsWith("blob:");
 }
 
 function HtmlIframePreview({ code }: { code: string }) {
@@ -59,7 +60,7 @@ export function ArtifactPanel({ code, onClose, reportName, reportPath }: Artifac
   const [tab, setTab] = useState("preview");
   const [width, setWidth] = useState(40);
   const dragging = useRef(false);
-  const isImage = isDataUrl(code);
+  const isImage = isImageUrl(code);
   const isHtml = !isImage && isFullHtmlDocument(code);
   const codeLanguage: BundledLanguage = isHtml ? "html" : "tsx";
   const fileName = isHtml ? "page.html" : "component.tsx";
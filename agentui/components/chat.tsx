@@ -24,10 +24,13 @@ import {
   type ReportFile,
   fetchReports,
   fetchReportContent,
+  fetchReportObjectUrl,
+  isImageReport,
   downloadReport,
   uploadReport,
   deleteReportApi,
   renameReportApi,
+  setReportPinnedApi,
 } from "@/lib/reports-api";
 import { UploadIcon } from "lucide-react";
 
@@ -96,6 +99,12 @@ export function Chat() {
   const abortRef = useRef<AbortController | null>(null);
   const dragCounter = useRef(0);
 
+  // Image previews are object URLs; release each one once the panel moves on.
+  useEffect(() => {
+    if (!artifactCode?.startsWith("blob:")) return;
+    return () => URL.revokeObjectURL(artifactCode);
+  }, [artifactCode]);
+
   // Auth check + load sessions on mount
   useEffect(() => {
     if (!isLoggedIn()) {
@@ -247,10 +256,10 @@ export function Chat() {
       return;
     }
     try {
-      const data = await fetchReportContent(report.path);
-      if (data.encoding === "base64" && report.type === "png") {
-        setArtifactCode(`data:image/png;base64,${data.content}`);
+      if (isImageReport(report.path)) {
+        setArtifactCode(await fetchReportObjectUrl(report.path));
       } else {
+        const data = await fetchReportContent(report.path);
         setArtifactCode(data.content);
       }
       setActiveReport(report);
@@ -293,6 +302,15 @@ export function Chat() {
     }
   }, []);
 
+  const handleToggleKeepReport = useCallback(async (report: ReportFile, pinned: boolean) => {
+    try {
+      await setReportPinnedApi(report.name, pinned);
+      await refreshReports();
+    } catch {
+      // ignore
+    }
+  }, []);
+
   const handleSubmit = useCallback(
     async (text: string) => {
       if (!text.trim() || !currentSessionId) return;
@@ -394,16 +412,10 @@ export function Chat() {
         let finalText = fullText;
 
         for (const path of viewContentPaths) {
+          // Images stay out of the message text; they are opened from the Files sidebar.
+          if (isImageReport(path)) continue;
           try {
-            const fetchRes = await fetch(
-              `${API_URL}/api/fetch_file?path=${encodeURIComponent(path)}`
-            );
-            if (!fetchRes.ok) {
-              finalText += `\n\nFailed to fetch preview content for ${path} (HTTP ${fetchRes.status}).`;
-              continue;
-            }
-
-            const file = (await fetchRes.json()) as FetchFileResponse;
+            const file: FetchFileResponse = await fetchReportContent(path);
             if (typeof file.content === "string" && file.content.length > 0) {
               finalText += buildArtifactCodeFence(file);
             }
@@ -541,6 +553,7 @@ export function Chat() {
         onUploadFile={handleUploadFile}
         onDeleteReport={handleDeleteReport}
         onRenameReport={handleRenameReport}
+        onToggleKeepReport={handleToggleKeepReport}
         width={sidebarWidth}
         onWidthChange={setSidebarWidth}
       />
@@ -1,9 +1,9 @@
 "use client";
 
-import { useCallback, useRef, useState } from "react";
+import { useCallback, useEffect, useRef, useState } from "react";
 import { cn } from "@/lib/utils";
 import type { ChatSession } from "@/lib/chat-store";
-import type { ReportFile } from "@/lib/reports-api";
+import { type ReportFile, fetchThumbnailUrl } from "@/lib/reports-api";
 import { Button } from "@/components/ui/button";
 import {
   Dialog,
@@ -34,6 +34,7 @@ import {
   PencilIcon,
   ExternalLinkIcon,
   DownloadIcon,
+  PinIcon,
 } from "lucide-react";
 import {
   DropdownMenu,
@@ -66,6 +67,7 @@ interface SidebarProps {
   onUploadFile: (file: File) => void;
   onDeleteReport: (report: ReportFile) => void;
   onRenameReport: (report: ReportFile, newName: string) => void;
+  onToggleKeepReport: (report: ReportFile, pinned: boolean) => void;
   width: number;
   onWidthChange: (width: number) => void;
 }
@@ -85,6 +87,50 @@ function fileIcon(type: string) {
   }
 }
 
+// PNG rows show the server's thumbnail, fetched once the row scrolls into view.
+function ReportThumbnail({ report }: { report: ReportFile }) {
+  const ref = useRef<HTMLSpanElement>(null);
+  const [src, setSrc] = useState<string | null>(null);
+
+  useEffect(() => {
+    const el = ref.current;
+    if (!el) return;
+    let url: string | null = null;
+    let cancelled = false;
+    const observer = new IntersectionObserver((entries) => {
+      if (!entries.some((e) => e.isIntersecting)) return;
+      observer.disconnect();
+      fetchThumbnailUrl(report.path)
+        .then((u) => {
+          if (cancelled) {
+            URL.revokeObjectURL(u);
+          } else {
+            url = u;
+            setSrc(u);
+          }
+        })
+        .catch(() => {});
+    });
+    observer.observe(el);
+    return () => {
+      cancelled = true;
+      observer.disconnect();
+      if (url) URL.revokeObjectURL(url);
+    };
+  }, [report.path, report.sha256]);
+
+  return (
+    <span ref={ref} className="shrink-0">
+      {src ? (
+        // eslint-disable-next-line @next/next/no-img-element
+        <img src={src} alt="" className="size-8 rounded object-cover" />
+      ) : (
+        fileIcon(report.type)
+      )}
+    </span>
+  );
+}
+
 export function Sidebar({
   sessions,
   currentSessionId,
@@ -103,6 +149,7 @@ export function Sidebar({
   onUploadFile,
   onDeleteReport,
   onRenameReport,
+  onToggleKeepReport,
   width,
   onWidthChange,
 }: SidebarProps) {
@@ -283,8 +330,17 @@ export function Sidebar({
                       className="group grid w-full grid-cols-[auto_1fr_auto] items-center gap-1 rounded px-2 py-1 text-sm cursor-pointer transition-colors hover:bg-muted/50"
                       onClick={() => onSelectReport(r)}
                     >
-                      <span className="shrink-0">{fileIcon(r.type)}</span>
-                      <span className="truncate">{r.name}</span>
+                      {r.type === "png" ? (
+                        <ReportThumbnail report={r} />
+                      ) : (
+                        <span className="shrink-0">{fileIcon(r.type)}</span>
+                      )}
+                      <span className="flex min-w-0 items-center gap-1">
+                        <span className="truncate">{r.name}</span>
+                        {r.pinned && (
+                          <PinIcon className="h-3 w-3 shrink-0 text-muted-foreground" aria-label="Kept" />
+                        )}
+                      </span>
                       <DropdownMenu>
                         <DropdownMenuTrigger asChild>
                           <button
@@ -300,7 +356,7 @@ export function Sidebar({
                               e.stopPropagation();
                               try {
                                 const res = await authFetch(
-                                  `${API_URL}/api/reports/download?path=${encodeURIComponent(r.path)}&inline=true`
+                                  `${API_URL}/api/reports/download?path=${encodeURIComponent(r.path)}&inline=true${r.sha256 ? `&v=${r.sha256}` : ""}`
                                 );
                                 const blob = await res.blob();
                                 const url = URL.createObjectURL(blob);
@@ -344,6 +400,17 @@ export function Sidebar({
                             <PencilIcon className="h-4 w-4" />
                             Rename
                           </DropdownMenuItem>
+                          {r.kind === "report" && (
+                            <DropdownMenuItem
+                              onClick={(e) => {
+                                e.stopPropagation();
+                                onToggleKeepReport(r, !r.pinned);
+                              }}
+                            >
+                              <PinIcon className="h-4 w-4" fill={r.pinned ? "currentColor" : "none"} />
+                              {r.pinned ? "Don't keep" : "Keep"}
+                            </DropdownMenuItem>
+                          )}
                           <DropdownMenuItem
                             variant="destructive"
                             onClick={(e) => {
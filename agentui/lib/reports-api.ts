@@ -4,26 +4,74 @@ import { authFetch } from "@/lib/auth";
 export interface ReportFile {
   name: string;
   path: string;
+  kind: "report" | "chart";
   type: string;
   sizeBytes: number;
   modifiedAt: string;
+  sha256: string | null;
+  pinned: boolean;
 }
 
+// /api/reports is paginated; follow nextCursor so the Files sidebar lists everything.
 export async function fetchReports(): Promise<ReportFile[]> {
-  const res = await authFetch(`${API_URL}/api/reports`);
-  if (!res.ok) throw new Error(`Failed to fetch reports: ${res.status}`);
-  const data = await res.json();
-  return data.files ?? [];
+  const files: ReportFile[] = [];
+  let cursor: string | null = null;
+  do {
+    const params = new URLSearchParams({ limit: "500" });
+    if (cursor) params.set("cursor", cursor);
+    const res = await authFetch(`${API_URL}/api/reports?${params}`);
+    if (!res.ok) throw new Error(`Failed to fetch reports: ${res.status}`);
+    const data = await res.json();
+    files.push(...(data.files ?? []));
+    cursor = data.nextCursor ?? null;
+  } while (cursor);
+  return files;
 }
 
-export async function fetchReportContent(
-  path: string
-): Promise<{ content: string; language: string; encoding?: string }> {
+export interface PreviewFile {
+  path: string;
+  language: string;
+  sizeBytes: number;
+  content: string;
+}
+
+export function isImageReport(path: string): boolean {
+  return /\.png$/i.test(path);
+}
+
+// Images come back as raw bytes; the caller revokes the object URL when done with it.
+export async function fetchReportObjectUrl(path: string): Promise<string> {
   const res = await authFetch(
-    `${API_URL}/api/fetch_file?path=${encodeURIComponent(path)}`
+    `${API_URL}/api/fetch_file?path=${encodeURIComponent(path)}&raw=true`
   );
   if (!res.ok) throw new Error(`Failed to fetch report content: ${res.status}`);
-  return res.json();
+  return URL.createObjectURL(await res.blob());
+}
+
+export async function fetchThumbnailUrl(path: string): Promise<string> {
+  const res = await authFetch(
+    `${API_URL}/api/reports/thumbnail?path=${encodeURIComponent(path)}`
+  );
+  if (!res.ok) throw new Error(`Failed to fetch thumbnail: ${res.status}`);
+  return URL.createObjectURL(await res.blob());
+}
+
+// Text previews are fetched in pages so reports larger than a single JSON response still load.
+export async function fetchReportContent(path: string): Promise<PreviewFile> {
+  let offset: number | null = 0;
+  let file: PreviewFile | null = null;
+  const parts: string[] = [];
+  while (offset !== null) {
+    const res = await authFetch(
+      `${API_URL}/api/fetch_file?path=${encodeURIComponent(path)}&offset=${offset}`
+    );
+    if (!res.ok) throw new Error(`Failed to fetch report content: ${res.status}`);
+    const page = await res.json();
+    file ??= page;
+    parts.push(page.content);
+    offset = page.nextOffset ?? null;
+  }
+  return { ...file!, content: parts.join("") };
 }
 
 export async function uploadReport(file: File): Promise<ReportFile> {
@@ -52,6 +100,19 @@ export async function renameReportApi(oldName: string, newName: string): Promise
   if (!res.ok) throw new Error(`Failed to rename report: ${res.status}`);
 }
 
+// Kept (pinned) reports are never evicted when the reports directory is over quota.
+export async function setReportPinnedApi(filename: string, pinned: boolean): Promise<void> {
+  const res = await authFetch(
+    `${API_URL}/api/reports/${encodeURIComponent(filename)}`,
+    {
+      method: "PATCH",
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify({ pinned }),
+    }
+  );
+  if (!res.ok) throw new Error(`Failed to update report: ${res.status}`);
+}
+
 export async function deleteReportApi(filename: string): Promise<void> {
   const res = await authFetch(
     `${API_URL}/api/reports/${encodeURIComponent(filename)}`,
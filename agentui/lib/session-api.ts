@@ -11,18 +11,64 @@ export interface ApiSession {
   messages?: ChatMessage[];
 }
 
-export async function fetchSessions(): Promise<ApiSession[]> {
-  const res = await authFetch(`${API_URL}/api/sessions`);
+export interface ApiSessionPage {
+  sessions: ApiSession[];
+  nextCursor: string | null;
+}
+
+export async function fetchSessionsPage(
+  cursor?: string | null,
+  limit: number = 50
+): Promise<ApiSessionPage> {
+  const params = new URLSearchParams({ limit: String(limit) });
+  if (cursor) params.set("cursor", cursor);
+  const res = await authFetch(`${API_URL}/api/sessions?${params}`);
   if (!res.ok) throw new Error(`Failed to fetch sessions: ${res.status}`);
   return res.json();
 }
 
+// Follows nextCursor so the sidebar gets every session, not just the first page.
+export async function fetchSessions(): Promise<ApiSession[]> {
+  const sessions: ApiSession[] = [];
+  let cursor: string | null = null;
+  do {
+    const page: ApiSessionPage = await fetchSessionsPage(cursor, 100);
+    sessions.push(...page.sessions);
+    cursor = page.nextCursor;
+  } while (cursor);
+  return sessions;
+}
+
 export async function fetchSession(id: string): Promise<ApiSession> {
   const res = await authFetch(`${API_URL}/api/sessions/${id}`);
   if (!res.ok) throw new Error(`Failed to fetch session: ${res.status}`);
   return res.json();
 }
 
+export interface ApiMessagePage {
+  messages: ChatMessage[];
+  nextCursor: string | null;
+  syncedAt?: string;
+}
+
+export async function fetchSessionMessages(
+  id: string,
+  opts: {
+    cursor?: string | null;
+    direction?: "before" | "after";
+    since?: string;
+    limit?: number;
+  } = {}
+): Promise<ApiMessagePage> {
+  const params = new URLSearchParams({ limit: String(opts.limit ?? 50) });
+  if (opts.cursor) params.set("cursor", opts.cursor);
+  if (opts.direction) params.set("direction", opts.direction);
+  if (opts.since) params.set("since", opts.since);
+  const res = await authFetch(`${API_URL}/api/sessions/${id}/messages?${params}`);
+  if (!res.ok) throw new Error(`Failed to fetch messages: ${res.status}`);
+  return res.json();
+}
+
 export async function createSessionApi(
   id: string,
   title: string = "New Chat"